@@ -2,22 +2,35 @@
 # -*- coding: utf-8 -*-
 
 from io import StringIO
-import json
-from random import randint, random
+import hashlib
+from random import randint, random, seed as random_seed
 
-import pymongo
 from pysmt.smtlib.parser import SmtLibParser
 from pysmt.walkers import TreeWalker, IdentityDagWalker
 from pysmt.rewritings import CNFizer
 from pysmt.shortcuts import *
 from equiv_walker import RandomEquivDagWalker
-from pysmt.exceptions import SolverReturnedUnknownResultError, NoLogicAvailableError
+from pysmt.exceptions import SolverReturnedUnknownResultError, NoLogicAvailableError, NoSolverAvailableError
 import tqdm
 from datetime import datetime
 
 from prop_walker import RandomWeakenerDagWalker
 from strengthener_walker import RandomStrengthenerDagWalker
-from symbol_walker import SymbolDagWalker
+from symbol_collector import SymbolCollector
+from smtlib_cache import IncrementalDagPrinter
+from solver_session import SolverSession, SolverTimeoutError, is_sat_once
+from worker_pool import WatchdogPool
+from pipe_solver import SOLVER_COMMANDS, PipeSession, PipeSolverError, installed_solvers, parse_command
+from cpu_layout import CoreLayout, available_cpus, pin
+from formula_index import clear_index_cache
+from pysmt.environment import push_env, pop_env
+from schedule import CostModel, chunks, longest_first
+from pysmt.oracles import SizeOracle
+from mutation_sites import SELECTION_MODES
+from seed_cache import SeedCache
+from result_writer import ResultWriter
+from formula_store import add_formula, formula_hashes, formula_key
+from result_sinks import SINKS, STRATEGIES, DEFAULT_OUTPUTS, JsonlSink, open_sink
 
 
 
@@ -28,13 +41,140 @@ import time
 import numpy
 import requests
 import traceback
+import argparse
+import functools
+from statistics import median
 import multiprocessing
 import pysmt
 
 
 CPUs = multiprocessing.cpu_count()
 
-def iterate_equivalence(formula,walker,symbols,logic,solver):
+SEED_PATH = "semantic-fusion-seeds-master/semantic-fusion-seeds-master/"
+LOGICS = ["QF_LIA","LIA","QF_LRA","LRA","QF_NRA","NRA"]
+SEED_CACHE_PATH = ".seed_cache"
+SEED_COSTS_PATH = ".seed_costs.json"
+RESULTS_LOG = "results.jsonl"
+
+# "session" keeps one live solver per (solver, logic) in every worker and
+# checks each mutant in a push/pop scope, "per_call" creates a new solver
+# for every check through is_sat, "pipe" drives a solver binary over its
+# SMT-LIB stdin/stdout instead of the python bindings
+SOLVER_MODES = ["session", "per_call", "pipe"]
+solver_mode = "session"
+solver_session = None
+pipe_session = None
+# every mutant is checked by all of these, the first one is the solver
+# of the step, the others only run in pipe mode next to it
+solvers = ["z3"]
+solver_commands = {}
+ANSWERS = {"sat": True, "unsat": False, "unknown": "unkown"}
+symbol_collector = None
+seed_cache = None
+smtlib_printer = None
+
+# seconds a single check may take and seconds all checks of one seed may
+# take, None for no limit
+query_timeout = None
+seed_budget = None
+seed_deadline = None
+# with measure_repeat set every check is repeated that many times after
+# measure_warmup runs that are not measured
+measure_repeat = 0
+measure_warmup = 1
+# share of the work of a seed in each strategy, the equivalence chain is
+# twice as long as the others
+STRATEGY_SHARES = {"equiv": 0.5, "strength_weaken": 0.25, "strength_weaken_equiv": 0.25}
+STRATEGY_WALKERS = {"equiv": ["equiv"], "strength_weaken": ["weaken", "strengthen"],
+                    "strength_weaken_equiv": ["weaken", "strengthen", "equiv"]}
+
+# "retry" rewalks the formula until a random walk_* fires, "single_pass"
+# lists every applicable site once and picks one of them
+selection_mode = "retry"
+
+def check_sat(formula,logic,solver):
+    if solver_mode == "session":
+        return solver_session.is_sat(formula,solver,logic)
+    if solver_mode == "pipe":
+        return pipe_session.is_sat(formula,formula_to_smtlib_string(formula),solver,logic)
+    return is_sat_once(formula,solver,timeout=query_timeout)
+
+def over_budget():
+    return seed_deadline is not None and time.monotonic() > seed_deadline
+
+def measure_check_sat(formula,logic,solver):
+    start_wall = time.perf_counter_ns()
+    start_cpu = time.process_time_ns()
+    try:
+        ret = check_sat(formula,logic,solver)
+    except SolverTimeoutError as e:
+        ret = "timeout"
+    except SolverReturnedUnknownResultError as e:
+        ret = "unkown"
+    except PipeSolverError as e:
+        # the solver rejected the mutant, its message is in solver_info
+        ret = "error"
+    wall = time.perf_counter_ns() - start_wall
+    cpu = time.process_time_ns() - start_cpu
+    if solver_mode == "pipe":
+        # from submit to answer, the statistics round trip after the answer
+        # is not part of the check; the CPU time is the solver process',
+        # None when it is not known
+        wall = pipe_session.elapsed(solver) or wall
+        cpu = pipe_session.cpu_elapsed(solver)
+    return ret, wall, cpu
+
+def solver_info(logic,solver):
+    # statistics and peak memory reported by a pipe solver
+    if solver_mode != "pipe":
+        return {}
+    info = pipe_session.info(solver)
+    return dict(("solver_" + key, value) for key, value in info.items())
+
+def differential_check_sat(formula,logic):
+    # all solvers get the mutant at the same time, the step keeps the result
+    # of the first one and the results of all of them; a solver that fails
+    # on the mutant is recorded with "error" and its message
+    text = formula_to_smtlib_string(formula)
+    results = pipe_session.check_all(formula,text,solvers,logic)
+    outcomes = {}
+    for name in solvers:
+        answer, elapsed = results[name]
+        outcomes[name] = dict(pipe_session.info(name),ret=ANSWERS.get(answer,answer),seconds=elapsed / 1e9)
+    first = outcomes[solvers[0]]
+    decided = set(outcome["ret"] for outcome in outcomes.values() if outcome["ret"] in (True,False))
+    if len(decided) > 1:
+        print(f"Solvers disagree on {logic} formula {formula_key(text)}: "
+              + ", ".join(f"{name}={outcome['ret']}" for name, outcome in outcomes.items()))
+    return first["ret"], first["seconds"], [{"solvers":outcomes,"disagreement":len(decided) > 1}]
+
+def timed_check_sat(formula,logic,solver):
+    # returns the result, the solve time in seconds and a list that holds,
+    # if there are any, the statistics of the repeated measurement and of
+    # the solvers
+    if len(solvers) > 1:
+        return differential_check_sat(formula,logic)
+    ret, wall, cpu = measure_check_sat(formula,logic,solver)
+    if not measure_repeat or ret in ("timeout","unkown","error"):
+        info = solver_info(logic,solver)
+        return ret, wall / 1e9, [info] if info else []
+    # the first check is the first warmup run
+    walls, cpus = ([], []) if measure_warmup else ([wall], [cpu])
+    for i in range(max(measure_warmup - 1, 0)):
+        measure_check_sat(formula,logic,solver)
+    while len(walls) < measure_repeat:
+        _, wall, cpu = measure_check_sat(formula,logic,solver)
+        walls.append(wall)
+        cpus.append(cpu)
+    timing = {"repeat":measure_repeat,"warmup":measure_warmup,
+              "min_ns":min(walls),"median_ns":int(median(walls)),"spread_ns":max(walls) - min(walls),
+              "cpu_min_ns":None,"cpu_median_ns":None,"cpu_spread_ns":None}
+    if None not in cpus:
+        timing.update(cpu_min_ns=min(cpus),cpu_median_ns=int(median(cpus)),cpu_spread_ns=max(cpus) - min(cpus))
+    timing.update(solver_info(logic,solver))
+    return ret, timing["median_ns"] / 1e9, [timing]
+
+def iterate_equivalence(formula,walker,symbols,logic,solver,formulas):
     data_point = []
     # formula, change, is_sat_ret
     
@@ -42,28 +182,31 @@ def iterate_equivalence(formula,walker,symbols,logic,solver):
     
     walked = formula
     for i in range(20):
+        if over_budget() or not walker.can_change(walked,symbols):
+            break
         old_walked = walked
         walked = walker.change_once(walked,symbols,old_walked)
         if old_walked == walked:
             break
-        start = time.time()
-        try:
-            ret = is_sat(walked,solver_name=solver)
-        except SolverReturnedUnknownResultError as e:
-            end = time.time()
-            ret = "unkown"
-        end = time.time()
-        data_point.append([formula_to_smtlib_string(walked),walker.change_id,ret,"equiv",logic,solver,end - start])
+        ret, elapsed, timing = timed_check_sat(walked,logic,solver)
+        data_point.append([add_formula(formulas,formula_to_smtlib_string(walked)),walker.change_id,ret,"equiv",logic,solver,elapsed,*timing])
     return data_point
 
-def iterate_strength_weaken(formula,s_walker,w_walker,symbols,logic,solver):
+def iterate_strength_weaken(formula,s_walker,w_walker,symbols,logic,solver,formulas):
     data_point = []
     # formula, change, is_sat_ret
     walkers = [w_walker,s_walker]
     walkers_descr = ["weaken","strengthen"]
     walked = formula
     for i in range(10):
-        coin_flip = randint(0,1)
+        if over_budget():
+            break
+        # a walker without an applicable rule in the current formula sits
+        # this step out, a mutation by the other one may give it one
+        candidates = [k for k, walker in enumerate(walkers) if walker.can_change(walked,symbols)]
+        if not candidates:
+            break
+        coin_flip = candidates[randint(0,len(candidates)-1)]
         walker = walkers[coin_flip]
         
         old_walked = walked
@@ -72,24 +215,23 @@ def iterate_strength_weaken(formula,s_walker,w_walker,symbols,logic,solver):
         
         if old_walked == walked:
             break
-        start = time.time()
-        try:
-            ret = is_sat(walked,solver_name=solver)
-        except SolverReturnedUnknownResultError as e:
-            end = time.time()
-            ret = "unkown"
-        end = time.time()
-        data_point.append([formula_to_smtlib_string(walked),walker.change_id,ret,walkers_descr[coin_flip],logic,solver,end - start])
+        ret, elapsed, timing = timed_check_sat(walked,logic,solver)
+        data_point.append([add_formula(formulas,formula_to_smtlib_string(walked)),walker.change_id,ret,walkers_descr[coin_flip],logic,solver,elapsed,*timing])
     return data_point
 
-def iterate_strength_weaken_equiv(formula,s_walker,w_walker,e_walker,symbols,logic,solver):
+def iterate_strength_weaken_equiv(formula,s_walker,w_walker,e_walker,symbols,logic,solver,formulas):
     data_point = []
     # formula, change, is_sat_ret, walker, logic
     walkers = [w_walker,s_walker,e_walker]
     walkers_descr = ["weaken","strengthen","equiv"]
     walked = formula
     for i in range(10):
-        coin_flip = randint(0,2)
+        if over_budget():
+            break
+        candidates = [k for k, walker in enumerate(walkers) if walker.can_change(walked,symbols)]
+        if not candidates:
+            break
+        coin_flip = candidates[randint(0,len(candidates)-1)]
         walker = walkers[coin_flip]
         
         old_walked = walked
@@ -98,14 +240,8 @@ def iterate_strength_weaken_equiv(formula,s_walker,w_walker,e_walker,symbols,log
         
         if old_walked == walked:
             break
-        start = time.time()
-        try:
-            ret = is_sat(walked,solver_name=solver)
-        except SolverReturnedUnknownResultError as e:
-            end = time.time()
-            ret = "unkown"
-        end = time.time()
-        data_point.append([formula_to_smtlib_string(walked),walker.change_id,ret,walkers_descr[coin_flip],logic,solver,end - start])
+        ret, elapsed, timing = timed_check_sat(walked,logic,solver)
+        data_point.append([add_formula(formulas,formula_to_smtlib_string(walked)),walker.change_id,ret,walkers_descr[coin_flip],logic,solver,elapsed,*timing])
     return data_point
 
 def formula_from_smtlib_string(str):
@@ -114,134 +250,395 @@ def formula_from_smtlib_string(str):
 
 
 def formula_to_smtlib_string(formula):
+    if smtlib_printer is not None:
+        return smtlib_printer.to_smtlib(formula)
     ret_str = formula.to_smtlib(daggify=True)
     return ret_str
 
-def analyze_block(formula):
-    
-    form = formula[0]
-    
-    status = mongo_connection["AUTSOFT"]["Z3"].find_one({"formula":formula_to_smtlib_string(form)})
-    
-    if status:
-       return 1 
-    
-    prop_walker = RandomWeakenerDagWalker(env=None,invalidate_memoization=True)
-    symbol_walker = SymbolDagWalker(env=None,invalidate_memoization=True)
-    strength_walker = RandomStrengthenerDagWalker(env=None,invalidate_memoization=True)
-    equiv_walker = RandomEquivDagWalker(env=None,invalidate_memoization=True)
+def analyze_block(task):
+    # every node a task builds, fresh symbols included, is interned in an
+    # environment of its own that is dropped as soon as the task is done
+    push_env()
+    open_scope()
+    try:
+        return analyze_strategy(task)
+    finally:
+        close_scope()
+        pop_env()
+
+def open_scope():
+    global parser, solver_session
+    # both hold on to the environment they were created in
+    parser = SmtLibParser()
+    solver_session = SolverSession(timeout=query_timeout)
+
+def close_scope():
+    global parser, solver_session
+    solver_session.close()
+    solver_session = None
+    parser = None
+    symbol_collector.clear()
+    smtlib_printer.clear()
+    clear_index_cache()
+
+def analyze_strategy(task):
+    global seed_deadline
     
-    dataZ3 = []
-    dataCVC4 = []
+    # seeds that are already in the database were filtered out in main,
+    # every seed is split into one task per strategy
+    seed, strategy = task
+    filepath, sat_unsat, logic, seed_digest = seed
+    try:
+        form = load_seed(filepath)
+    except Exception as e:
+        # unparsable seeds are skipped
+        return 0
+    formula = [form, sat_unsat, logic]
     
+    prop_walker = RandomWeakenerDagWalker(env=None,invalidate_memoization=True,selection=selection_mode)
+    strength_walker = RandomStrengthenerDagWalker(env=None,invalidate_memoization=True,selection=selection_mode)
+    equiv_walker = RandomEquivDagWalker(env=None,invalidate_memoization=True,selection=selection_mode)
     
+    # the tasks of a seed run in different workers, seeding the random
+    # generator with its hash makes all of them start from the same formula
+    random_seed(seed_digest)
     form = equiv_walker.walk(form)
+    random_seed(seed_digest + strategy)
     start = time.time()
+    # the chain stops early once it ran out of its share of the seed budget
+    seed_deadline = time.monotonic() + seed_budget * STRATEGY_SHARES[strategy] if seed_budget else None
+    failed = {"seed_hash":seed_digest,"strategy":strategy,"failed":True}
     try:
-        symbols = symbol_walker.get_symbols(form)
-        solver_name="z3"
+        symbols = symbol_collector.symbols(form)
+        solver_name=solvers[0]
         
-        start = time.time()
-        try:
-            ret = is_sat(form,solver_name=solver_name)
-        except SolverReturnedUnknownResultError as e:
-            end = time.time()
-            ret = "unkown"
-        end = time.time()
+        # steps refer to their formula by hash, the texts are stored once
+        formulas = {}
+        part = {"seed_hash":seed_digest,"strategy":strategy,"formulas":formulas,"cpus":available_cpus()}
+        if strategy == STRATEGIES[0]:
+            ret, elapsed, timing = timed_check_sat(form,formula[2],solver_name)
+            part["formula"] = add_formula(formulas,formula_to_smtlib_string(form))
+            part["initial"] = [part["formula"],-1,ret,"initial",formula[2],solver_name,elapsed,*timing]
+            part["nodes"] = form.size(SizeOracle.MEASURE_DAG_NODES)
         
-        dataZ3.append([formula_to_smtlib_string(form),-1,ret,"initial",formula[2],solver_name,end - start])
-        
-        dataZ3.append( [*[iterate_equivalence(form,equiv_walker,symbols,formula[2],solver_name)],formula[1]])
-        dataZ3.append( [*[iterate_strength_weaken(form,strength_walker,prop_walker,symbols,formula[2],solver_name)],formula[1]])
-        dataZ3.append( [*[iterate_strength_weaken_equiv(form,strength_walker,prop_walker,equiv_walker, symbols,formula[2],solver_name)],formula[1]])
+        # the chains skip, at every step, the walkers that have no
+        # applicable rule in the current formula; the ones without a rule
+        # in the seed are recorded
+        walkers = {"weaken":prop_walker,"strengthen":strength_walker,"equiv":equiv_walker}
+        part["no_rule"] = [name for name in STRATEGY_WALKERS[strategy] if not walkers[name].can_change(form,symbols)]
+        if strategy == "equiv":
+            steps = iterate_equivalence(form,equiv_walker,symbols,formula[2],solver_name,formulas)
+        elif strategy == "strength_weaken":
+            steps = iterate_strength_weaken(form,strength_walker,prop_walker,symbols,formula[2],solver_name,formulas)
+        else:
+            steps = iterate_strength_weaken_equiv(form,strength_walker,prop_walker,equiv_walker, symbols,formula[2],solver_name,formulas)
         end = time.time()
         """ solver_name="cvc4"
         dataCVC4.append( [*[iterate_equivalence(form,equiv_walker,symbols,formula[2],solver_name)],formula[1]])
         dataCVC4.append( [*[iterate_strength_weaken(form,strength_walker,prop_walker,symbols,formula[2],solver_name)],formula[1]])
         dataCVC4.append( [*[iterate_strength_weaken_equiv(form,strength_walker,prop_walker,equiv_walker, symbols,formula[2],solver_name)],formula[1]]) """
         #print(".")
-        collection = mongo_connection["AUTSOFT"]["Z3"]
-        findings = {"formula":formula_to_smtlib_string(form),"data":dataZ3 ,"execution_time": end-start}
-        try:
-            collection.insert_one(findings)
-        except pymongo.errors.DuplicateKeyError:
-            pass
-        return dataZ3
+        part.update({"steps":steps,"sat_unsat":formula[1],"execution_time":end-start,"budget_exceeded":over_budget()})
+        if len(solvers) > 1:
+            checked = steps + [part["initial"]] if "initial" in part else steps
+            part["disagreements"] = sum(1 for step in checked if step[7]["disagreement"])
+            part["solver_errors"] = dict((name, sum(1 for step in checked if step[7]["solvers"][name]["ret"] == "error"))
+                                         for name in solvers)
+        return part
     
-    except NoLogicAvailableError as e:
-        return 0
+    except (NoLogicAvailableError, NoSolverAvailableError) as e:
+        # per_call mode resolves the logic of the formula, the session
+        # asks for a solver of the logic named by the seed's directory
+        return failed
     
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         print(e)
-        return 0
-    
+        return failed
 
-def init_process(t):
-    global mongo_connection
-    mongo_connection = pymongo.MongoClient("mongodb://"+"127.0.0.1"+":"+"27017", maxPoolSize=None)
-    global collection 
-    collection = mongo_connection["AUTSOFT"]["Z3"]
-    return
+def merge_parts(parts, layout=None):
+    # joins the results of the strategy tasks of a seed into its document
+    first = parts[STRATEGIES[0]]
+    formulas = {}
+    for part in parts.values():
+        formulas.update(part["formulas"])
+    data = [first["initial"]] + [[parts[strategy]["steps"], parts[strategy]["sat_unsat"]]
+                                 for strategy in STRATEGIES]
+    result = {"seed_hash":first["seed_hash"],"formula":first["formula"],"data":data,
+            "execution_time":sum(part["execution_time"] for part in parts.values()),
+            "formulas":formulas,
+            "budget_exceeded":any(part["budget_exceeded"] for part in parts.values()),
+            "nodes":first["nodes"],
+            # walkers that had no applicable rule in the seed itself
+            "no_rule":sorted(set().union(*(part["no_rule"] for part in parts.values()))),
+            "core_layout":dict(layout.describe() if layout else {"pinned":False},
+                               cpus=dict((strategy, parts[strategy]["cpus"]) for strategy in STRATEGIES))}
+    if "disagreements" in first:
+        result["disagreements"] = sum(part["disagreements"] for part in parts.values())
+        result["solver_errors"] = dict((name, sum(part["solver_errors"][name] for part in parts.values()))
+                                       for name in first["solver_errors"])
+    return result
 
-def parse():
-    global parser
-    data = []
-    parser = SmtLibParser()
-    #data is of the form [formula, sat/unsat]
-    
-    path = "semantic-fusion-seeds-master/semantic-fusion-seeds-master/"
+def init_process(options):
+    global solver_mode, selection_mode, symbol_collector, seed_cache, smtlib_printer, query_timeout, seed_budget, measure_repeat, measure_warmup, pipe_session, solvers, solver_commands
+    solver_mode = options["solver_mode"]
+    solvers = options["solvers"]
+    solver_commands = dict(map(parse_command, options["solver_command"]))
+    selection_mode = options["selection"]
+    seed_cache = SeedCache(options["seed_cache"]) if options["seed_cache"] else None
+    query_timeout = options["query_timeout"] or None
+    seed_budget = options["seed_budget"] or None
+    measure_repeat = options["repeat"]
+    measure_warmup = options["warmup"]
+    if solver_mode == "pipe":
+        # the solver processes outlive the per task environments
+        pipe_session = PipeSession(timeout=query_timeout,commands=solver_commands)
+    symbol_collector = SymbolCollector()
+    smtlib_printer = IncrementalDagPrinter()
+    return
 
-    logics = ["QF_LIA","LIA","QF_LRA","LRA","QF_NRA","NRA"]
+def discover_seeds(path=None):
+    # yields [filepath, sat/unsat, logic] lazily so the pool can start
+    # working while the corpus is still being listed
+    path = SEED_PATH if path is None else path
 
-    for logic in logics:
-        path_to_logic = path + logic + "/"
+    for logic in LOGICS:
+        path_to_logic = os.path.join(path, logic)
         
         for sat_unsat in ["sat","unsat"]:
             
-            directory = os.fsencode(path_to_logic+sat_unsat)
+            directory = os.path.join(path_to_logic, sat_unsat)
+            if not os.path.isdir(directory):
+                continue
     
-            for file in os.listdir(directory):
-                filename = os.fsdecode(file)
-                filepath = os.fspath(file)
-                if filename.endswith(".smt2"): 
-                    # print(os.path.join(directory, filename))
-                    with open(path_to_logic+sat_unsat+"/"+filename,"r") as f:
-                        try:
-                            script = parser.get_script(f)
-                            formula = script.get_last_formula()
-                            data.append([formula,sat_unsat,logic])
-                        except:
-                            pass
-                else:
-                    continue
-    return data
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".smt2") and entry.is_file():
+                        yield [entry.path,sat_unsat,logic]
+
+def seed_hash(filepath):
+    # stable content hash of a seed, used as its key in the database
+    digest = hashlib.sha256()
+    with open(filepath,"rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def pending_seeds(seeds, done):
+    for filepath, sat_unsat, logic in seeds:
+        digest = seed_hash(filepath)
+        if digest not in done:
+            yield [filepath, sat_unsat, logic, digest]
+
+def load_seed(filepath):
+    if seed_cache is not None:
+        return seed_cache.load(filepath, parser)
+    with open(filepath,"r") as f:
+        script = parser.get_script(f)
+    return script.get_last_formula()
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Benchmark Z3 and CVC4 on mutated SMT-LIB seeds")
+    arg_parser.add_argument("--solver-mode", choices=SOLVER_MODES, default=solver_mode,
+                            help="reuse one solver per worker (session), create one per check (per_call) "
+                                 "or drive solver binaries over SMT-LIB pipes (pipe)")
+    arg_parser.add_argument("--solvers", type=lambda names: names.split(","), default=solvers,
+                            help="comma separated solvers that check every mutant; with more than one, "
+                                 "the pipe mode runs them at the same time and flags disagreements")
+    arg_parser.add_argument("--solver-command", action="append", default=[], metavar="NAME=COMMAND",
+                            help="command line of a solver binary for the pipe mode, may be repeated")
+    arg_parser.add_argument("--selection", choices=SELECTION_MODES, default=selection_mode,
+                            help="how walkers pick the mutation site in change_once")
+    arg_parser.add_argument("--seed-path", default=SEED_PATH,
+                            help="directory holding one folder per logic with sat/unsat seeds")
+    arg_parser.add_argument("--seed-cache", default=SEED_CACHE_PATH,
+                            help="directory of the parsed-seed cache, pass an empty string to disable it")
+    arg_parser.add_argument("--repeat", type=int, default=0,
+                            help="measure every check this many times and store min, median and spread "
+                                 "of wall and CPU time, 0 for a single measurement")
+    arg_parser.add_argument("--warmup", type=int, default=1,
+                            help="unmeasured checks before the repeated ones")
+    arg_parser.add_argument("--query-timeout", type=float, default=60,
+                            help="seconds a single check may take before it is recorded as timeout, 0 for no limit")
+    arg_parser.add_argument("--seed-budget", type=float, default=900,
+                            help="seconds of checks per seed after which its chains stop, 0 for no limit")
+    arg_parser.add_argument("--task-timeout", type=float, default=None,
+                            help="seconds after which a worker stuck on one seed is killed and replaced, "
+                                 "by default the seed budget plus two query timeouts, 0 for no watchdog")
+    arg_parser.add_argument("--pin", action="store_true",
+                            help="pin every worker to a physical core of its own, siblings stay idle")
+    arg_parser.add_argument("--reserve-cores", type=int, default=1,
+                            help="physical cores kept for the main process and the writer when pinning")
+    arg_parser.add_argument("--max-tasks-per-child", type=int, default=0,
+                            help="tasks after which a worker is replaced by a fresh one, 0 for no limit")
+    arg_parser.add_argument("--max-rss", type=float, default=2048,
+                            help="megabytes of resident memory after which a worker is replaced, 0 for no limit")
+    arg_parser.add_argument("--seed-costs", default=SEED_COSTS_PATH,
+                            help="file with the analysis time of every seed seen so far, used to run expensive seeds first")
+    arg_parser.add_argument("--sink", choices=SINKS, default="mongo",
+                            help="where the results are written")
+    arg_parser.add_argument("--output", default=None,
+                            help="target of the sink: a mongodb:// url ending in /<database>/<collection>, "
+                                 "a file for jsonl and sqlite or a directory for parquet")
+    arg_parser.add_argument("--results-log", default=RESULTS_LOG,
+                            help="line-delimited file every result is appended to as it arrives, "
+                                 "pass an empty string to disable it")
+    arg_parser.add_argument("--batch-size", type=int, default=64,
+                            help="number of results written to the sink at once")
+    arg_parser.add_argument("--flush-interval", type=float, default=2.0,
+                            help="seconds a result may wait for its batch to fill up")
+    arg_parser.add_argument("--max-pending", type=int, default=1024,
+                            help="results queued for the writer before workers block")
+    args = arg_parser.parse_args()
+    if len(args.solvers) > 1 and args.solver_mode != "pipe":
+        arg_parser.error("several --solvers need --solver-mode=pipe")
+    if len(args.solvers) > 1 and args.repeat:
+        arg_parser.error("--repeat measures a single solver")
+    # every worker runs all solvers of a check at the same time, so the
+    # cores are shared out per solver process, not per worker
+    args.layout = None
+    if args.pin:
+        try:
+            args.layout = CoreLayout(reserve=args.reserve_cores, cores_per_worker=len(args.solvers))
+        except ValueError as e:
+            arg_parser.error(str(e))
+    if args.solver_mode == "pipe":
+        try:
+            commands = dict(SOLVER_COMMANDS, **dict(map(parse_command, args.solver_command)))
+        except ValueError as e:
+            arg_parser.error(str(e))
+        missing = [name for name in args.solvers if name not in installed_solvers(commands)]
+        if missing:
+            arg_parser.error(f"solvers not installed: {', '.join(missing)}; "
+                             f"installed: {', '.join(installed_solvers(commands)) or 'none'}")
+    return args
+
+def task_timeout(args):
+    if args.task_timeout is not None:
+        return args.task_timeout or None
+    if not args.seed_budget:
+        return None
+    # a check that started just before the budget ran out may still take
+    # one query timeout, the second one leaves room for parsing and writing
+    return args.seed_budget + 2 * (args.query_timeout or 60)
+
+def open_results_log(args):
+    # with the jsonl sink writing to the same file the log would only
+    # duplicate every line
+    if not args.results_log:
+        return None
+    output = args.output if args.output is not None else DEFAULT_OUTPUTS[args.sink]
+    if args.sink == "jsonl" and os.path.abspath(output) == os.path.abspath(args.results_log):
+        return None
+    # results arrive seconds apart and the log is what a crashed run is
+    # recovered from, so every one is flushed right away
+    return JsonlSink(args.results_log)
+
 def main():
-    
+    args = parse_args()
+    analyzed = 0
+    writer = None
+    results_log = None
+    cost_model = None
     try:
-        data = parse()
-    
+        sink = open_sink(args.sink, args.output)
+        done = sink.done_hashes()
+        sink.close()
+        results_log = open_results_log(args)
+
         if sys.platform.startswith("linux"):
             multiprocessing.set_start_method("fork", force=True)
-            
+
+        layout = args.layout
+        processes = max(1, CPUs // len(args.solvers))
+        if layout is not None:
+            # the writer started below inherits the reserved cores
+            if layout.reserved:
+                pin(layout.reserved)
+            processes = len(layout.workers)
+            print(f"Pinning {processes} workers to cores {layout.workers}, reserved {layout.reserved}")
+
+        writer = ResultWriter(functools.partial(open_sink, args.sink, args.output),
+                              batch_size=args.batch_size, flush_interval=args.flush_interval,
+                              max_pending=args.max_pending).start()
+        if results_log is not None:
+            # results that made it to the log but not to the sink before
+            # the last run stopped are written again instead of recomputed
+            missing = [record for record in results_log.records()
+                       if record["seed_hash"] not in done]
+            texts = results_log.read_formulas(set().union(*map(formula_hashes, missing)))
+            for record in missing:
+                record["formulas"] = dict((key, texts[key]) for key in formula_hashes(record))
+                writer.put(record)
+                done.add(record["seed_hash"])
+            print(f"Replayed {len(missing)} results from {args.results_log}")
+        print(f"Skipping {len(done)} already analyzed seeds")
+        # longest expected first needs the whole list, but listing and
+        # hashing seeds is cheap next to analyzing them
+        cost_model = CostModel(args.seed_costs)
+        tasks = [(seed, strategy) for seed in pending_seeds(discover_seeds(args.seed_path), done)
+                 for strategy in STRATEGIES]
+        costs = longest_first(tasks, lambda task: cost_model.estimate(task[0]) * STRATEGY_SHARES[task[1]])
+        seed_timeout = task_timeout(args)
+
         print("Running analysis of SMT Solver for Z3 and CVC4")
         print("Initializing workers...")
-        result_data=[]
-        #test = analyze_block(data[0])
-        with multiprocessing.Pool(processes=CPUs, initializer=init_process, initargs=("t")) as pool:
+        #test = analyze_block(next(seeds))
+        with WatchdogPool(processes=processes, initializer=init_process, initargs=(vars(args),),
+                          cpus=layout.workers if layout else None,
+                          task_timeout=seed_timeout,
+                          max_tasks=args.max_tasks_per_child or None,
+                          max_rss=args.max_rss * 2**20 or None) as pool:
             start_total = time.time()
             
-            for result in (pbar:=tqdm.tqdm(pool.imap_unordered(analyze_block, data, ),desc="Formulas", total= len(data),bar_format="{l_bar}{bar} [ time left: {remaining}, time spent: {elapsed}]")):
-                    result_data.append(result)
-                    pbar.set_description(f'Nr Analyzed: {len(result_data)}; Current Time: {datetime.now()}')
-                    pbar.update()
+            pbar = tqdm.tqdm(total=len(costs),desc="Formulas",bar_format="{l_bar}{bar} [ time left: {remaining}, time spent: {elapsed}]")
+            # strategy results of seeds that are not complete yet
+            parts = {}
+            failed = set()
+            disagreements = 0
+            # chunks only save round trips, results and the watchdog are per task
+            for part in pool.imap_unordered(analyze_block, chunks(costs, processes), chunked=True):
+                pbar.update()
+                if not part or part["seed_hash"] in failed:
+                    continue
+                if part.get("failed"):
+                    failed.add(part["seed_hash"])
+                    parts.pop(part["seed_hash"], None)
+                    continue
+                seed_parts = parts.setdefault(part["seed_hash"], {})
+                seed_parts[part["strategy"]] = part
+                if len(seed_parts) < len(STRATEGIES):
+                    continue
+                result = merge_parts(parts.pop(part["seed_hash"]), layout)
+                analyzed += 1
+                disagreements += bool(result.get("disagreements"))
+                cost_model.record(result["seed_hash"], result["execution_time"], result["nodes"])
+                # logged first, so a result the writer fails on is
+                # replayed by the next run
+                if results_log is not None:
+                    results_log.write_many([result])
+                # blocks while the writer is behind
+                writer.put(result)
+                pbar.set_description(f'Nr Analyzed: {analyzed}; Current Time: {datetime.now()}')
+            pbar.close()
             end_total = time.time()
+            lost = set(seed[3] for seed, _ in pool.lost)
+            for digest in lost:
+                # hung seeds go first next time
+                cost_model.record(digest, seed_timeout or end_total - start_total)
+            if len(args.solvers) > 1:
+                print(f"Solvers disagreed on {disagreements} of {analyzed} seeds")
+            if lost:
+                print(f"Gave up on {len(lost)} seeds whose worker hung or died")
+            print("Peak memory per worker:")
+            for pid, tasks_done, peak in pool.memory:
+                print(f"  pid {pid}: {tasks_done} tasks, {peak / 2**20:.1f} MB")
             
             
             print("Total execution time: ")
             print()
-            if result_data:
+            if analyzed:
                 print("Max execution time: ")
                 print("Mean execution time: ")
                 print("Median execution time")
@@ -249,8 +646,12 @@ def main():
     except KeyboardInterrupt as e:
         print("KEYBOARDINTERRUPT")
     finally:
-        with open("results.txt","w") as f:
-            f.write(json.dumps(result_data))
+        if cost_model is not None:
+            cost_model.save()
+        if writer is not None:
+            writer.close()
+        if results_log is not None:
+            results_log.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+
+
+TOPOLOGY_PATH = "/sys/devices/system/cpu/cpu%d/topology"
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read_topology(cpu, name):
+    try:
+        with open(os.path.join(TOPOLOGY_PATH % cpu, name), "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def physical_cores(cpus=None):
+    """Groups the logical CPUs by the physical core they belong to and
+    returns one sorted list of hyperthread siblings per core. Without
+    topology information every CPU counts as a core of its own."""
+    cpus = available_cpus() if cpus is None else cpus
+    cores = {}
+    for cpu in cpus:
+        package = _read_topology(cpu, "physical_package_id")
+        core = _read_topology(cpu, "core_id")
+        key = (package, core) if core is not None else ("cpu", cpu)
+        cores.setdefault(key, []).append(cpu)
+    return sorted((sorted(siblings) for siblings in cores.values()),
+                  key=lambda siblings: siblings[0])
+
+
+class CoreLayout(object):
+    """Assignment of physical cores to the stages of a run.
+
+    The first ``reserve`` cores, with all their siblings, are kept for the
+    main process and the writer. Each worker gets cores_per_worker of the
+    remaining cores for itself, one per solver it runs at a time; only the
+    first sibling of a core is used so that no two solvers share a core.
+    """
+
+    def __init__(self, reserve=1, cpus=None, cores_per_worker=1):
+        cores = physical_cores(cpus)
+        if len(cores) < reserve + cores_per_worker:
+            raise ValueError("pinning needs %d physical cores, found %d"
+                             % (reserve + cores_per_worker, len(cores)))
+        self.cores = cores
+        self.reserved = sorted(cpu for siblings in cores[:reserve] for cpu in siblings)
+        free = [siblings[0] for siblings in cores[reserve:]]
+        self.workers = [free[i:i + cores_per_worker]
+                        for i in range(0, len(free) - cores_per_worker + 1, cores_per_worker)]
+
+    def describe(self):
+        return {"pinned": True,
+                "physical_cores": len(self.cores),
+                "smt": any(len(siblings) > 1 for siblings in self.cores),
+                "reserved": self.reserved,
+                "workers": self.workers}
+
+
+def pin(cpus):
+    os.sched_setaffinity(0, cpus)
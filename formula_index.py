@@ -0,0 +1,171 @@
+from collections import Counter
+
+from pysmt.environment import get_env
+
+from mutation_rules import RULES
+
+
+class FormulaIndex(object):
+    """Parent pointers and a node type index for the DAG of one formula.
+
+    ``replace`` swaps a single node for another one and rebuilds only the
+    ancestors of that node, every other subterm of the formula is reused
+    as-is. The index is updated in place, so it can follow a whole mutation
+    chain without being rebuilt: ``parents`` counts, for every node that is
+    reachable from the root, how often each present node has it as an
+    argument, and nodes that lose their last parent are dropped.
+
+    ``sites_of(rule)`` lists the nodes a rule of RULES applies to. The
+    guards are evaluated once, when a node enters the index.
+    """
+
+    def __init__(self, formula, env=None):
+        self.env = env if env is not None else get_env()
+        self.mgr = self.env.formula_manager
+        self.root = formula
+        self.parents = {}
+        self.by_type = {}
+        self.sites = {}
+        self._add(formula)
+
+    def __contains__(self, node):
+        return node in self.parents
+
+    def __len__(self):
+        return len(self.parents)
+
+    def nodes_of_type(self, node_type):
+        return self.by_type.get(node_type, ())
+
+    def sites_of(self, rule):
+        return self.sites.get(rule, ())
+
+    def _add(self, formula):
+        if formula in self.parents:
+            return
+        stack = [formula]
+        self._register(formula)
+        while stack:
+            node = stack.pop()
+            for child in node.args():
+                if child not in self.parents:
+                    self._register(child)
+                    stack.append(child)
+                self.parents[child][node] += 1
+
+    def _register(self, node):
+        self.parents[node] = Counter()
+        self.by_type.setdefault(node.node_type(), set()).add(node)
+        for rule in RULES.of_type(node.node_type()):
+            if rule.applies(node):
+                self.sites.setdefault(rule, set()).add(node)
+
+    def _remove(self, formula):
+        stack = [formula]
+        while stack:
+            node = stack.pop()
+            del self.parents[node]
+            self.by_type[node.node_type()].discard(node)
+            for rule in RULES.of_type(node.node_type()):
+                nodes = self.sites.get(rule)
+                if nodes:
+                    nodes.discard(node)
+            for child in node.args():
+                child_parents = self.parents.get(child)
+                if child_parents is None:
+                    # already dropped through an earlier argument
+                    continue
+                child_parents[node] -= 1
+                if child_parents[node] <= 0:
+                    del child_parents[node]
+                if not child_parents and child is not self.root:
+                    stack.append(child)
+
+    def ancestors(self, node):
+        """Returns the ancestors of node, children before parents."""
+        order = []
+        visited = set([node])
+        stack = [(node, iter(self.parents[node]))]
+        while stack:
+            current, it = stack[-1]
+            parent = next(it, None)
+            if parent is None:
+                stack.pop()
+                order.append(current)
+            elif parent not in visited:
+                visited.add(parent)
+                stack.append((parent, iter(self.parents[parent])))
+        order.reverse()
+        # order[0] is node itself
+        return order[1:]
+
+    def rebuild(self, formula, args):
+        return self.mgr.create_node(formula.node_type(), tuple(args),
+                                    formula._content.payload)
+
+    def replace(self, node, replacement):
+        """Replaces every occurrence of node by replacement and returns the
+        new root. Only the spine from node up to the root is rebuilt."""
+        if node is replacement:
+            return self.root
+        rebuilt = {node: replacement}
+        for ancestor in self.ancestors(node):
+            args = [rebuilt.get(a, a) for a in ancestor.args()]
+            rebuilt[ancestor] = self.rebuild(ancestor, args)
+
+        old_root = self.root
+        new_root = rebuilt.get(old_root, old_root)
+        # add the new spine first so subterms shared with the old one keep
+        # their parents while the old spine is dropped
+        self.root = new_root
+        self._add_spine(new_root, rebuilt)
+        if old_root is not new_root and old_root in self.parents \
+           and not self.parents[old_root]:
+            self._remove(old_root)
+        return new_root
+
+    def advance(self, formula):
+        """Moves the index to formula, a mutation of the root made without
+        going through ``replace``. Only the nodes formula does not share
+        with the old root are added, the ones only the old root reached are
+        dropped."""
+        if formula is self.root:
+            return
+        old_root = self.root
+        self.root = formula
+        self._add(formula)
+        if old_root in self.parents and not self.parents[old_root]:
+            self._remove(old_root)
+
+    def _add_spine(self, new_root, rebuilt):
+        if new_root not in self.parents:
+            self._add(new_root)
+            return
+        # the new root was already part of the formula (e.g. the root was
+        # replaced by one of its own subterms): only the replacement and
+        # the rebuilt nodes can be new
+        for new_node in rebuilt.values():
+            self._add(new_node)
+
+
+_latest_index = None
+
+
+def index_for(formula, env=None):
+    """Returns the index of formula, reusing the index left behind by the
+    last replace when formula is its root."""
+    global _latest_index
+    if _latest_index is None or _latest_index.root is not formula:
+        _latest_index = FormulaIndex(formula, env=env)
+    return _latest_index
+
+
+def advance_index(formula, mutated):
+    """Moves the cached index of formula, if there is one, to mutated."""
+    if _latest_index is not None and _latest_index.root is formula:
+        _latest_index.advance(mutated)
+
+
+def clear_index_cache():
+    global _latest_index
+    _latest_index = None
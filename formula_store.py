@@ -0,0 +1,79 @@
+import base64
+import hashlib
+import zlib
+from collections import OrderedDict
+
+
+def formula_key(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def compress_formula(text):
+    return zlib.compress(text.encode())
+
+
+def decompress_formula(data):
+    return zlib.decompress(data).decode()
+
+
+def encode_formula_text(text):
+    # compressed and still JSON safe, for the line-delimited sinks
+    return base64.b64encode(compress_formula(text)).decode()
+
+
+def decode_formula_text(data):
+    return decompress_formula(base64.b64decode(data))
+
+
+def add_formula(formulas, text):
+    """Adds text to the formulas of a record and returns the hash that
+    step records use to refer to it."""
+    key = formula_key(text)
+    formulas.setdefault(key, text)
+    return key
+
+
+def formula_hashes(record):
+    """Every formula hash a record refers to: the seed formula and the
+    first field of each step."""
+    data = record["data"]
+    hashes = set([record["formula"], data[0][0]])
+    for steps, _ in data[1:]:
+        hashes.update(step[0] for step in steps)
+    return hashes
+
+
+def resolve_record(record, texts):
+    """Returns a copy of record with every formula hash replaced by the
+    text found in texts."""
+    data = record["data"]
+    initial = [texts[data[0][0]]] + list(data[0][1:])
+    chains = [[[[texts[step[0]]] + list(step[1:]) for step in steps], sat_unsat]
+              for steps, sat_unsat in data[1:]]
+    resolved = dict((k, v) for k, v in record.items() if k != "formulas")
+    resolved["formula"] = texts[record["formula"]]
+    resolved["data"] = [initial] + chains
+    return resolved
+
+
+class KnownFormulas(object):
+    """Bounded set of the formula hashes a sink has already written, so that
+    repeated mutants are not sent to the store again. Hashes that fell out
+    are caught by the store's own deduplication."""
+
+    def __init__(self, max_entries=1 << 16):
+        self.max_entries = max_entries
+        self.hashes = OrderedDict()
+
+    def new_formulas(self, records):
+        new = {}
+        for record in records:
+            for key, text in record.get("formulas", {}).items():
+                if key in self.hashes:
+                    self.hashes.move_to_end(key)
+                    continue
+                new[key] = text
+                self.hashes[key] = True
+                if len(self.hashes) > self.max_entries:
+                    self.hashes.popitem(last=False)
+        return new
@@ -0,0 +1,51 @@
+import pysmt.operators as op
+
+
+# walk_* methods of these types call walk_symbol on their variables or
+# function name, which may draw random numbers or collect the symbol
+NAMED_TYPES = frozenset([op.FORALL, op.EXISTS, op.FUNCTION])
+
+
+class IdentityShortcutMixin(object):
+    """Skips rebuilding nodes that a walk leaves unchanged.
+
+    A node whose type is not in ``active_types`` and whose children all
+    walked to themselves is memoized as itself, without calling its walk_*
+    method, so the walk does no type checking and no hash-cons lookup on
+    it. Walkers list in ``active_types`` every node type whose walk_* method
+    must run anyway, because it may mutate the node or has side effects,
+    and use ``unchanged`` in the rebuild branch of those methods.
+
+    The shortcut is only taken for formulas of the walker's own
+    environment, nodes of another one are still rebuilt.
+    """
+
+    active_types = frozenset()
+
+    def walk(self, formula, **kwargs):
+        self.shortcut = self.mgr.formulae.get(formula._content) is formula
+        return super(IdentityShortcutMixin, self).walk(formula, **kwargs)
+
+    def unchanged(self, formula, args):
+        if not self.shortcut:
+            return False
+        for new, old in zip(args, formula.args()):
+            if new is not old:
+                return False
+        return True
+
+    def _compute_node_result(self, formula, **kwargs):
+        key = self._get_key(formula, **kwargs)
+        if key in self.memoization:
+            return
+        args = [self.memoization[self._get_key(s, **kwargs)]
+                for s in self._get_children(formula)]
+        node_type = formula.node_type()
+        if node_type not in self.active_types and self.unchanged(formula, args):
+            self.memoization[key] = formula
+            return
+        try:
+            f = self.functions[node_type]
+        except KeyError:
+            f = self.walk_error
+        self.memoization[key] = f(formula, args=args, **kwargs)
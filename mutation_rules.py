@@ -0,0 +1,150 @@
+import pysmt.operators as op
+
+
+class Rule(object):
+    """One mutation of a walker.
+
+    ``rule_id`` is the change_id the results record for it and never
+    changes once released. The rule can fire at nodes of ``node_type``
+    for which ``guard(node)`` holds (None means always); the guard only
+    looks at the node and its subterms, so it holds for a node once and for
+    all. ``precondition(walker)`` covers what depends on the walker instead,
+    like the symbols of the seed. ``rewrite`` names the walker method that
+    makes the change; one method may make several rules.
+    """
+
+    def __init__(self, walker, rule_id, name, node_type, rewrite,
+                 guard=None, precondition=None):
+        self.walker = walker
+        self.rule_id = rule_id
+        self.name = name
+        self.node_type = node_type
+        self.rewrite = rewrite
+        self.guard = guard
+        self.precondition = precondition
+
+    def applies(self, node):
+        return self.guard is None or self.guard(node)
+
+    def ready(self, walker):
+        return self.precondition is None or self.precondition(walker)
+
+    def __repr__(self):
+        return "Rule(%s, %d, %s)" % (self.walker, self.rule_id, self.name)
+
+
+class RuleRegistry(object):
+
+    def __init__(self):
+        self.rules = []
+        self.by_name = {}
+        self.by_id = {}
+        self.by_type = {}
+
+    def register(self, walker, rule_id, name, node_type, rewrite,
+                 guard=None, precondition=None):
+        if (walker, rule_id) in self.by_id or (walker, name) in self.by_name:
+            raise ValueError("rule %s/%d %s registered twice" % (walker, rule_id, name))
+        rule = Rule(walker, rule_id, name, node_type, rewrite, guard, precondition)
+        self.rules.append(rule)
+        self.by_id[(walker, rule_id)] = rule
+        self.by_name[(walker, name)] = rule
+        self.by_type.setdefault(node_type, []).append(rule)
+        return rule
+
+    def get(self, walker, name):
+        return self.by_name[(walker, name)]
+
+    def lookup(self, walker, rule_id):
+        """The rule behind a recorded (walker, change_id) pair, if any."""
+        return self.by_id.get((walker, rule_id))
+
+    def of_type(self, node_type):
+        return self.by_type.get(node_type, ())
+
+    def for_walker(self, walker):
+        return [rule for rule in self.rules if rule.walker == walker]
+
+    def names(self, walker):
+        return dict((rule.rule_id, rule.name) for rule in self.for_walker(walker))
+
+
+def is_bool_symbol(node):
+    return node.symbol_type().is_bool_type()
+
+
+def has_symbols(walker):
+    return len(walker.symbols) > 1
+
+
+def is_negation(node, other):
+    # node is what Not(other) would build, without building it
+    if other.is_not():
+        return node is other.arg(0)
+    return node.is_not() and node.arg(0) is other
+
+
+def child_types(*node_types):
+    """Guard on the types of the first len(node_types) arguments, a tuple
+    allows any of its types."""
+    def guard(node):
+        args = node.args()
+        if len(args) < len(node_types):
+            return False
+        for arg, node_type in zip(args, node_types):
+            allowed = node_type if isinstance(node_type, tuple) else (node_type,)
+            if arg.node_type() not in allowed:
+                return False
+        return True
+    return guard
+
+
+def is_xor_shape(node):
+    # (a and not b) or (not a and b)
+    if not child_types(op.AND, op.AND)(node):
+        return False
+    left, right = node.arg(0).args(), node.arg(1).args()
+    return is_negation(left[0], right[0]) and is_negation(left[1], right[1])
+
+
+def shares_right(node):
+    return child_types(op.OR, op.OR)(node) and node.arg(0).arg(1) is node.arg(1).arg(1)
+
+
+def shares_left(node):
+    return child_types(op.OR, op.OR)(node) and not shares_right(node) \
+        and node.arg(0).arg(0) is node.arg(1).arg(0)
+
+
+ATOM = (op.SYMBOL, op.NOT)
+
+RULES = RuleRegistry()
+
+RULES.register("weaken", 0, "symbol_or_symbol", op.SYMBOL, "weaken_symbol", is_bool_symbol, has_symbols)
+RULES.register("weaken", 1, "and_drop_operand", op.AND, "weaken_and")
+RULES.register("weaken", 2, "xor_to_or", op.OR, "weaken_or", is_xor_shape)
+RULES.register("weaken", 3, "or_to_implies", op.OR, "weaken_or")
+RULES.register("weaken", 4, "equals_to_le", op.EQUALS, "weaken_equals")
+RULES.register("weaken", 5, "lt_relax", op.LT, "weaken_lt")
+RULES.register("weaken", 7, "plus_fresh_operand", op.PLUS, "weaken_plus")
+RULES.register("weaken", 8, "times_fresh_operand", op.TIMES, "weaken_times")
+RULES.register("weaken", 9, "minus_fresh_operand", op.MINUS, "weaken_minus")
+RULES.register("weaken", 10, "div_fresh_operand", op.DIV, "weaken_div")
+
+RULES.register("strengthen", 0, "or_drop_operand", op.OR, "strengthen_or")
+RULES.register("strengthen", 1, "symbol_and_symbol", op.SYMBOL, "strengthen_symbol", is_bool_symbol, has_symbols)
+RULES.register("strengthen", 2, "or_to_xor", op.OR, "strengthen_or")
+RULES.register("strengthen", 3, "implies_not_to_or", op.IMPLIES, "strengthen_implies", child_types(op.NOT))
+RULES.register("strengthen", 5, "not_equals_to_lt", op.NOT, "strengthen_not", child_types(op.EQUALS))
+RULES.register("strengthen", 6, "le_to_lt", op.LE, "strengthen_le")
+
+RULES.register("equiv", 0, "and_commute", op.AND, "rewrite_and")
+RULES.register("equiv", 11, "and_of_nots_to_not_and", op.AND, "rewrite_and", child_types(op.NOT, op.NOT))
+RULES.register("equiv", 12, "and_factor_right", op.AND, "rewrite_and", shares_right)
+RULES.register("equiv", 13, "and_factor_left", op.AND, "rewrite_and", shares_left)
+RULES.register("equiv", 1, "or_commute", op.OR, "rewrite_or")
+RULES.register("equiv", 5, "or_distribute_left", op.OR, "rewrite_or", child_types(op.AND, ATOM))
+RULES.register("equiv", 6, "or_distribute_right", op.OR, "rewrite_or", child_types(ATOM, op.AND))
+RULES.register("equiv", 10, "or_of_nots_to_not_and", op.OR, "rewrite_or", child_types(op.NOT, op.NOT))
+RULES.register("equiv", 3, "not_and_de_morgan", op.NOT, "rewrite_not", child_types(op.AND))
+RULES.register("equiv", 4, "not_or_de_morgan", op.NOT, "rewrite_not", child_types(op.OR))
@@ -0,0 +1,106 @@
+from random import choices
+
+from formula_index import advance_index, index_for
+
+
+SELECTION_MODES = ["retry", "single_pass"]
+
+
+class SiteSelectionMixin(object):
+    """Shared change_once for the random walkers.
+
+    In "retry" mode the formula is rewalked up to 20 times until one of the
+    rules happens to fire (see RewriteDagWalker). In "single_pass" mode every applicable
+    (node, rule) site is listed in one traversal of the DAG and exactly one
+    of them is picked, uniformly or by ``site_weights``, a dict from rule
+    id (see RULES) to weight, and applied.
+
+    Walkers provide ``rule_groups``, a dict from (node type, rewrite name)
+    to the rules of RULES that the rewrite method makes. The sites of a
+    rule are the nodes where it applies, looked up in the rule index of the
+    formula's FormulaIndex instead of testing every node.
+    ``rewrite(node, args)`` returns the replacement and sets ``change_id``,
+    the same rewrite is used by both modes; in "single_pass" mode
+    ``target_rule`` names the rule it has to make.
+
+    Single-pass mutations go through the FormulaIndex as well, which
+    rebuilds only the ancestors of the mutated node instead of the whole
+    formula and keeps the rule index up to date. After a "retry" mutation
+    the index is moved to the new formula (see FormulaIndex.advance).
+    """
+
+    def init_site_selection(self, selection="retry", site_weights=None):
+        if selection not in SELECTION_MODES:
+            raise ValueError("Unknown selection mode '%s'" % selection)
+        self.selection = selection
+        self.site_weights = site_weights
+
+    def can_change(self, formula, symbols):
+        """Tells, from the rule index of formula, whether any rule of the
+        walker applies somewhere in it. Without one, change_once returns
+        formula unchanged, after 20 walks in "retry" mode. Building the
+        index walks formula once; along a mutation chain both modes move
+        the index to each mutant, so later checks only index the new
+        nodes."""
+        self.symbols = symbols
+        try:
+            index = index_for(formula, env=self.env)
+            return any(rule.ready(self) and index.sites_of(rule)
+                       for rules in self.rule_groups.values() for rule in rules)
+        finally:
+            self.symbols = set()
+
+    def change_once(self,formula,symbols,old_formula):
+        if self.selection == "single_pass":
+            return self.change_once_single_pass(formula, symbols)
+        self.symbols = symbols
+        if self.flag_changed:
+            self.flag_changed = False
+            self.change_id = -1
+        i = 0
+        while not self.flag_changed and i < 20:
+            ret = self.walk(formula)
+            i+=1
+        self.symbols = set()
+        advance_index(formula, ret)
+        return ret
+
+    def applicable_sites(self, formula):
+        """Returns every (node, rule, rewrite) triple that can fire in
+        formula, one per rule that applies at the node, looking only at the
+        nodes whose type has a rule."""
+        index = index_for(formula, env=self.env)
+        sites = []
+        for (_, name), rules in self.rule_groups.items():
+            rewrite = getattr(self, name)
+            for rule in rules:
+                if rule.ready(self):
+                    sites.extend((node, rule, rewrite) for node in index.sites_of(rule))
+        return sites
+
+    def choose_site(self, sites):
+        if self.site_weights is None:
+            return choices(sites)[0]
+        weights = [self.site_weights.get(rule.rule_id, 1) for _, rule, _ in sites]
+        return choices(sites, weights=weights)[0]
+
+    def change_once_single_pass(self, formula, symbols):
+        self.symbols = symbols
+        self.flag_changed = False
+        self.change_id = -1
+        sites = self.applicable_sites(formula)
+        if not sites:
+            self.symbols = set()
+            return formula
+        node, rule, rewrite = self.choose_site(sites)
+        # the rewrite makes the chosen rule, not one of its others
+        self.target_rule = rule.name
+        try:
+            replacement = rewrite(node, list(node.args()))
+        finally:
+            self.target_rule = None
+        self.symbols = set()
+        return self.replace_node(formula, node, replacement)
+
+    def replace_node(self, formula, node, replacement):
+        return index_for(formula, env=self.env).replace(node, replacement)
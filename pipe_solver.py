@@ -0,0 +1,388 @@
+import ctypes
+import os
+import re
+import select
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from pysmt.environment import get_env
+from pysmt.exceptions import SolverReturnedUnknownResultError
+from pysmt.smtlib.printers import quote
+
+from solver_session import SolverTimeoutError
+from worker_pool import cpu_time_ns, peak_rss_bytes, reset_peak_rss
+
+
+# how a solver binary is started in incremental SMT-LIB mode, any other
+# solver that reads SMT-LIB from stdin can be added with parse_command
+SOLVER_COMMANDS = {
+    "z3": ["z3", "-in", "-smt2"],
+    "cvc4": ["cvc4", "--incremental", "--lang=smt2"],
+    "cvc5": ["cvc5", "--incremental", "--lang=smt2"],
+    "yices": ["yices-smt2", "--incremental"],
+    "mathsat": ["mathsat"],
+}
+
+
+class PipeSolverError(Exception):
+    pass
+
+
+def die_with_parent():
+    # a worker killed by the watchdog takes its solver processes along
+    ctypes.CDLL(None).prctl(1, signal.SIGKILL)  # PR_SET_PDEATHSIG
+
+
+def parse_command(spec):
+    """Splits a "name=command line" option into the name and the command."""
+    name, sep, command = spec.partition("=")
+    if not sep or not name or not command.strip():
+        raise ValueError("expected NAME=COMMAND, got %r" % spec)
+    return name, shlex.split(command)
+
+
+def installed_solvers(commands=None):
+    """Names of the solvers whose binary is on the PATH."""
+    commands = SOLVER_COMMANDS if commands is None else commands
+    return [name for name, command in commands.items() if shutil.which(command[0])]
+
+
+def declarations(formula):
+    return "".join("(declare-fun %s %s)\n" % (quote(s.symbol_name()),
+                                              s.symbol_type().as_smtlib(funstyle=True))
+                   for s in formula.get_free_variables())
+
+
+def query_logic(formula, logic):
+    """The logic a check of formula is declared in: the seed's logic, or
+    its nonlinear counterpart once a mutation, e.g. a fresh factor in a
+    product, made formula nonlinear, which solvers reject in a linear
+    logic."""
+    if "L" not in logic or get_env().theoryo.get_theory(formula).linear:
+        return logic
+    return logic.replace("LIRA", "NIRA").replace("LIA", "NIA").replace("LRA", "NRA")
+
+
+STATISTIC = re.compile(r":([^\s()]+)\s+([^\s()]+)")
+
+
+def parse_statistics(text):
+    """Turns a (:name value ...) reply of get-info into a dict."""
+    statistics = {}
+    for name, value in STATISTIC.findall(text):
+        for kind in (int, float):
+            try:
+                value = kind(value)
+                break
+            except ValueError:
+                pass
+        statistics[name] = value
+    return statistics
+
+
+def statistics_delta(totals, previous):
+    # counters grow over the life of the process, memory figures are
+    # gauges and kept as reported
+    delta = {}
+    for name, value in totals.items():
+        before = previous.get(name, 0)
+        if isinstance(value, (int, float)) and isinstance(before, (int, float)) \
+           and "memory" not in name:
+            value = value - before
+        delta[name] = value
+    return delta
+
+
+class PipeSolver(object):
+    """A long-lived solver process driven over its SMT-LIB stdin/stdout.
+
+    Every check runs in its own (push)/(pop) scope with the declarations of
+    the free variables of the formula, so the process is reused for a whole
+    mutation chain. After each check ``info`` holds the solver's statistics
+    for that check, the difference of its totals to those after the
+    previous check, and the peak RSS of the process during the check, None
+    where the peak cannot be reset. A check that is not answered within
+    timeout seconds, or answered with an error, kills the process, the
+    next check starts a new one.
+
+    check waits for the answer; submit and poll let the caller wait on
+    several solvers at once. ``elapsed`` and ``cpu_elapsed`` give the wall
+    time and the solver process' CPU time of the last check from submit to
+    answer, without the statistics round trip.
+    """
+
+    def __init__(self, command, logic, timeout=None):
+        self.command = command
+        self.logic = logic
+        self.timeout = timeout
+        self.process = None
+        self.buffer = ""
+        self.info = {}
+        self.deadline = None
+        self.submitted = None
+        self.answered = None
+        self.cpu_submitted = None
+        self.cpu_answered = None
+        self.totals = {}
+        self.peak_reset = False
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        text=True, bufsize=1,
+                                        preexec_fn=die_with_parent if sys.platform.startswith("linux") else None)
+        self.buffer = ""
+        self.totals = {}
+        self.send("(set-option :print-success false)\n(set-logic %s)\n" % self.logic)
+
+    def send(self, text):
+        self.process.stdin.write(text)
+        self.process.stdin.flush()
+
+    def read_response(self, deadline=None):
+        """Reads one answer, an atom or a parenthesized s-expression."""
+        while True:
+            response = self._take_response()
+            if response is not None:
+                return response
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+            if not ready:
+                raise SolverTimeoutError()
+            self._read_more()
+
+    def _read_more(self):
+        data = os.read(self.process.stdout.fileno(), 1 << 16).decode()
+        if not data:
+            raise PipeSolverError("%s exited" % self.command[0])
+        self.buffer += data
+
+    def _take_response(self):
+        text = self.buffer.lstrip()
+        if not text:
+            return None
+        if text[0] != "(":
+            end = text.find("\n")
+            if end < 0:
+                return None
+            self.buffer = text[end + 1:]
+            return text[:end].strip()
+        depth = 0
+        in_string = False
+        for i, c in enumerate(text):
+            if c == '"':
+                in_string = not in_string
+            elif in_string:
+                continue
+            elif c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+                if depth == 0:
+                    self.buffer = text[i + 1:]
+                    return text[:i + 1]
+        return None
+
+    def submit(self, formula, text):
+        """Sends the check of formula, whose SMT-LIB text is given by the
+        caller, without waiting for the answer."""
+        self.answered = None
+        self.cpu_answered = None
+        if self.process is None:
+            self.start()
+        self.peak_reset = reset_peak_rss(self.process.pid)
+        self.deadline = time.monotonic() + self.timeout if self.timeout else None
+        self.cpu_submitted = cpu_time_ns(self.process.pid)
+        self.submitted = time.perf_counter_ns()
+        self._guard(self.send, "(push 1)\n%s(assert %s)\n(check-sat)\n"
+                    % (declarations(formula), text))
+
+    def wait(self):
+        """Returns "sat", "unsat" or "unknown" for the submitted check."""
+        return self._guard(lambda: self._finish(self.read_response(self.deadline)))
+
+    def poll(self):
+        """Reads what the solver wrote so far, only to be called when its
+        stdout is readable. Returns the answer once it is complete."""
+        return self._guard(self._poll)
+
+    def expire(self):
+        """Gives up on the submitted check."""
+        self._guard(self._expire)
+
+    def check(self, formula, text):
+        self.submit(formula, text)
+        return self.wait()
+
+    def _poll(self):
+        self._read_more()
+        answer = self._take_response()
+        return None if answer is None else self._finish(answer)
+
+    def _expire(self):
+        raise SolverTimeoutError()
+
+    def _finish(self, answer):
+        self.answered = time.perf_counter_ns()
+        self.cpu_answered = cpu_time_ns(self.process.pid)
+        if answer.startswith("(error"):
+            raise PipeSolverError(answer)
+        self.send("(get-info :all-statistics)\n(pop 1)\n")
+        totals = parse_statistics(self.read_response(self.deadline))
+        self.info = {"statistics": statistics_delta(totals, self.totals), "peak_rss": self.peak_rss()}
+        self.totals = totals
+        return answer
+
+    def elapsed(self):
+        """Returns the wall nanoseconds of the last check, None for a check
+        that was not answered."""
+        if self.answered is None:
+            return None
+        return self.answered - self.submitted
+
+    def cpu_elapsed(self):
+        """Returns the CPU nanoseconds the solver process used for the last
+        check, None for a check that was not answered or where /proc is
+        not available."""
+        if self.cpu_answered is None or self.cpu_submitted is None:
+            return None
+        return self.cpu_answered - self.cpu_submitted
+
+    def peak_rss(self):
+        return peak_rss_bytes(self.process.pid) if self.peak_reset else None
+
+    def _guard(self, func, *args):
+        # a process that timed out or failed is not reused
+        try:
+            return func(*args)
+        except SolverTimeoutError:
+            self.info = {"peak_rss": self.peak_rss()}
+            self.kill()
+            raise
+        except (PipeSolverError, OSError) as e:
+            self.info = {"error": str(e)}
+            self.kill()
+            raise
+
+    def kill(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    def exit(self):
+        if self.process is None:
+            return
+        try:
+            self.send("(exit)\n")
+            self.process.wait(1)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+
+class PipeSession(object):
+    """Keeps one PipeSolver per (solver, logic) pair, like SolverSession
+    does for pysmt solvers. The logic of a check is the one query_logic
+    picks for the formula, so nonlinear mutants of a linear seed go to
+    a process of their own. The processes do not depend on any pysmt
+    environment and live as long as the worker."""
+
+    def __init__(self, timeout=None, commands=None):
+        self.timeout = timeout
+        self.commands = dict(SOLVER_COMMANDS, **(commands or {}))
+        self.solvers = {}
+        # the solver that made the last check of each name
+        self.last = {}
+
+    def get_solver(self, solver_name, logic):
+        key = (solver_name, logic)
+        solver = self.solvers.get(key)
+        if solver is None:
+            solver = PipeSolver(self.commands[solver_name], logic, self.timeout)
+            self.solvers[key] = solver
+        self.last[solver_name] = solver
+        return solver
+
+    def is_sat(self, formula, text, solver_name, logic):
+        """Raises PipeSolverError when the solver answered with an error."""
+        solver = self.get_solver(solver_name, query_logic(formula, logic))
+        answer = solver.check(formula, text)
+        if answer == "sat":
+            return True
+        if answer == "unsat":
+            return False
+        raise SolverReturnedUnknownResultError(answer)
+
+    def check_all(self, formula, text, solver_names, logic):
+        """Checks formula on all solvers at the same time.
+
+        Returns {solver name: (answer, nanoseconds)} where answer is "sat",
+        "unsat", "unknown", "timeout" or "error"; info has the details.
+        Every solver is timed from its own submit to its own answer.
+        """
+        results = {}
+        pending = {}
+        logic = query_logic(formula, logic)
+        for name in solver_names:
+            solver = self.get_solver(name, logic)
+            try:
+                solver.submit(formula, text)
+            except (PipeSolverError, OSError):
+                results[name] = ("error", 0)
+                continue
+            pending[solver.process.stdout] = (name, solver)
+        while pending:
+            deadlines = [solver.deadline for _, solver in pending.values() if solver.deadline]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            ready, _, _ = select.select(list(pending), [], [], timeout)
+            for stream in ready:
+                name, solver = pending[stream]
+                try:
+                    answer = solver.poll()
+                except SolverTimeoutError:
+                    # the answer came, the statistics after it did not
+                    answer = "timeout"
+                except (PipeSolverError, OSError):
+                    answer = "error"
+                if answer is not None:
+                    del pending[stream]
+                    results[name] = (answer, (solver.answered or time.perf_counter_ns()) - solver.submitted)
+            now = time.monotonic()
+            for stream, (name, solver) in list(pending.items()):
+                if solver.deadline is not None and now >= solver.deadline:
+                    del pending[stream]
+                    results[name] = ("timeout", time.perf_counter_ns() - solver.submitted)
+                    try:
+                        solver.expire()
+                    except SolverTimeoutError:
+                        pass
+        return results
+
+    def elapsed(self, solver_name):
+        """Wall nanoseconds of the last check of solver_name, see
+        PipeSolver.elapsed."""
+        solver = self.last.get(solver_name)
+        return solver.elapsed() if solver is not None else None
+
+    def cpu_elapsed(self, solver_name):
+        """CPU nanoseconds of the last check of solver_name, see
+        PipeSolver.cpu_elapsed."""
+        solver = self.last.get(solver_name)
+        return solver.cpu_elapsed() if solver is not None else None
+
+    def info(self, solver_name):
+        """Statistics of the last check of solver_name, see PipeSolver."""
+        solver = self.last.get(solver_name)
+        return solver.info if solver is not None else {}
+
+    def close(self):
+        for solver in self.solvers.values():
+            solver.exit()
+        self.solvers = {}
+        self.last = {}
@@ -0,0 +1,486 @@
+import json
+import os
+import sqlite3
+import time
+
+import pymongo
+
+from formula_store import (KnownFormulas, compress_formula, decompress_formula,
+                           decode_formula_text, encode_formula_text,
+                           formula_hashes, resolve_record)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+SINKS = ["mongo", "jsonl", "sqlite", "parquet"]
+DEFAULT_OUTPUTS = {
+    "mongo": "mongodb://127.0.0.1:27017/AUTSOFT/Z3",
+    "jsonl": "results.jsonl",
+    "sqlite": "results.sqlite",
+    "parquet": "results_parquet",
+}
+
+# order of the chains in the "data" list of a result, after the initial step
+STRATEGIES = ["equiv", "strength_weaken", "strength_weaken_equiv"]
+# columns of a step row, all others hold the extra statistics of a step
+STEP_COLUMNS = ["seed_hash", "strategy", "step", "formula", "change_id", "result",
+                "walker", "logic", "solver", "seconds", "expected"]
+# extra statistics that are dicts, stored as JSON text in step rows
+JSON_COLUMNS = ["solvers", "solver_statistics"]
+# types of the columns of the parquet datasets; a step's extra statistics
+# that are not listed go to the JSON text of its "extra" column
+SEED_TYPES = [("seed_hash", "string"), ("formula", "string"),
+              ("execution_time", "double"), ("expected", "string"), ("metadata", "string")]
+STEP_TYPES = [("seed_hash", "string"), ("strategy", "string"), ("step", "int64"),
+              ("formula", "string"), ("change_id", "int64"), ("result", "string"),
+              ("walker", "string"), ("logic", "string"), ("solver", "string"),
+              ("seconds", "double"), ("expected", "string"),
+              # --repeat
+              ("repeat", "int64"), ("warmup", "int64"),
+              ("min_ns", "int64"), ("median_ns", "int64"), ("spread_ns", "int64"),
+              ("cpu_min_ns", "int64"), ("cpu_median_ns", "int64"), ("cpu_spread_ns", "int64"),
+              # pipe solvers
+              ("solver_statistics", "string"), ("solver_peak_rss", "int64"),
+              ("solver_error", "string"), ("solvers", "string"), ("disagreement", "bool"),
+              ("extra", "string")]
+FORMULA_TYPES = [("hash", "string"), ("text", "binary")]
+
+
+def without_formulas(record):
+    return dict((k, v) for k, v in record.items() if k != "formulas")
+
+
+def record_metadata(record):
+    """The per-seed fields of a record besides those that the SQLite and
+    Parquet sinks store in columns of their own, as JSON text."""
+    return json.dumps(dict((k, v) for k, v in record.items()
+                           if k not in ("seed_hash", "formula", "execution_time",
+                                        "data", "formulas")))
+
+
+def step_rows(record):
+    """Flattens the data of one seed into one dict per solved formula."""
+    data = record["data"]
+    chains = [("initial", [data[0]], None)]
+    chains.extend((name, steps, sat_unsat)
+                  for name, (steps, sat_unsat) in zip(STRATEGIES, data[1:]))
+    rows = []
+    for strategy, steps, sat_unsat in chains:
+        for index, step in enumerate(steps):
+            formula, change_id, ret, walker, logic, solver, seconds = step[:7]
+            row = {
+                "seed_hash": record["seed_hash"],
+                "strategy": strategy,
+                "step": index,
+                "formula": formula,
+                "change_id": change_id,
+                "result": str(ret),
+                "walker": walker,
+                "logic": logic,
+                "solver": solver,
+                "seconds": seconds,
+                "expected": sat_unsat,
+            }
+            # statistics of runs with --repeat or of the solvers
+            extra = dict(step[7]) if len(step) > 7 else {}
+            for key in JSON_COLUMNS:
+                if key in extra:
+                    extra[key] = json.dumps(extra[key])
+            row.update(extra)
+            rows.append(row)
+    return rows
+
+
+class ResultSink(object):
+    """Destination of the per-seed result documents.
+
+    Sinks are created inside the process that writes to them, receive
+    records in batches through write_many and report which seeds they
+    already hold through done_hashes, so that a run can skip them.
+
+    Records refer to formulas by hash and carry the texts in their
+    "formulas" field. Sinks store those texts once, compressed, apart from
+    the records, and read_result puts them back together.
+    """
+
+    def write_many(self, records):
+        raise NotImplementedError
+
+    def done_hashes(self):
+        return set()
+
+    def flush(self):
+        """Makes the records written so far durable, for sinks that buffer."""
+        pass
+
+    def read_record(self, seed_hash):
+        raise NotImplementedError
+
+    def read_formulas(self, hashes):
+        raise NotImplementedError
+
+    def read_result(self, seed_hash):
+        """Returns the record of a seed with every formula hash replaced by
+        its text, or None if the seed is not stored."""
+        record = self.read_record(seed_hash)
+        if record is None:
+            return None
+        return resolve_record(record, self.read_formulas(formula_hashes(record)))
+
+    def close(self):
+        pass
+
+
+class MemorySink(ResultSink):
+    """Keeps records in a list, a stand-in for tests and dry runs."""
+
+    def __init__(self):
+        self.records = []
+        self.formulas = {}
+        self.batches = 0
+
+    def write_many(self, records):
+        for record in records:
+            for key, text in record.get("formulas", {}).items():
+                self.formulas.setdefault(key, compress_formula(text))
+            self.records.append(without_formulas(record))
+        self.batches += 1
+
+    def done_hashes(self):
+        return set(record["seed_hash"] for record in self.records)
+
+    def read_record(self, seed_hash):
+        for record in self.records:
+            if record["seed_hash"] == seed_hash:
+                return record
+        return None
+
+    def read_formulas(self, hashes):
+        return dict((key, decompress_formula(self.formulas[key])) for key in hashes)
+
+
+class MongoSink(ResultSink):
+    """Writes one document per seed with insert_many. The target is a
+    mongodb:// url ending in /<database>/<collection>, formula texts go to
+    <collection>_formulas keyed by their hash."""
+
+    def __init__(self, target, retry_delay=1.0):
+        url, database, name = target.rsplit("/", 2)
+        self.client = pymongo.MongoClient(url)
+        self.collection = self.client[database][name]
+        self.formulas = self.client[database][name + "_formulas"]
+        self.known = KnownFormulas()
+        self.retry_delay = retry_delay
+        # the partial filter keeps documents written before seed_hash
+        # existed from clashing on the unique index
+        self.collection.create_index("seed_hash", unique=True,
+                                     partialFilterExpression={"seed_hash": {"$exists": True}})
+
+    def write_many(self, records):
+        formulas = self.known.new_formulas(records)
+        if formulas:
+            self._insert(self.formulas, [{"_id": key, "text": compress_formula(text)}
+                                         for key, text in formulas.items()])
+        self._insert(self.collection, [without_formulas(record) for record in records])
+
+    def _insert(self, collection, documents):
+        while True:
+            try:
+                collection.insert_many(documents, ordered=False)
+                return
+            except pymongo.errors.BulkWriteError as e:
+                # seeds that are already stored are fine, anything else is not
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != 11000 for error in errors):
+                    raise
+                return
+            except pymongo.errors.AutoReconnect:
+                # the database is unavailable, the bounded queue in front
+                # of the writer makes the workers wait until it is back
+                time.sleep(self.retry_delay)
+
+    def done_hashes(self):
+        done = set()
+        for doc in self.collection.find({"seed_hash": {"$exists": True}},
+                                        {"seed_hash": 1, "_id": 0}):
+            done.add(doc["seed_hash"])
+        return done
+
+    def read_record(self, seed_hash):
+        return self.collection.find_one({"seed_hash": seed_hash}, {"_id": 0})
+
+    def read_formulas(self, hashes):
+        return dict((doc["_id"], decompress_formula(doc["text"]))
+                    for doc in self.formulas.find({"_id": {"$in": list(hashes)}}))
+
+    def close(self):
+        self.client.close()
+
+
+class JsonlSink(ResultSink):
+    """Appends one JSON document per line. Formula texts are appended to
+    <target>.formulas as compressed base64 lines. write_many flushes the
+    files at most every flush_interval seconds, the rest is left to flush,
+    which the writer calls once that long passed without a write, and to
+    close."""
+
+    def __init__(self, target, flush_interval=0.0):
+        self.path = target
+        self.formulas_path = target + ".formulas"
+        self.flush_interval = flush_interval
+        self.known = KnownFormulas()
+        self.file = None
+        self.formulas_file = None
+        self.last_flush = 0.0
+
+    def write_many(self, records):
+        if self.file is None:
+            self.file = open(self.path, "a")
+            self.formulas_file = open(self.formulas_path, "a")
+        # formulas first, so a record never refers to text that is missing
+        for key, text in self.known.new_formulas(records).items():
+            self.formulas_file.write(json.dumps({"hash": key, "text": encode_formula_text(text)}))
+            self.formulas_file.write("\n")
+        for record in records:
+            self.file.write(json.dumps(without_formulas(record)))
+            self.file.write("\n")
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.file is not None:
+            self.formulas_file.flush()
+            self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut short by a crash
+                    continue
+                if "seed_hash" in record:
+                    yield record
+
+    def done_hashes(self):
+        return set(record["seed_hash"] for record in self.records())
+
+    def read_record(self, seed_hash):
+        for record in self.records():
+            if record["seed_hash"] == seed_hash:
+                return record
+        return None
+
+    def read_formulas(self, hashes):
+        texts = {}
+        if not os.path.exists(self.formulas_path):
+            return texts
+        with open(self.formulas_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry["hash"] in hashes:
+                    texts[entry["hash"]] = decode_formula_text(entry["text"])
+        return texts
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.formulas_file.close()
+            self.file = None
+            self.formulas_file = None
+
+
+class SqliteSink(ResultSink):
+    """Stores one row per seed in a SQLite database in WAL mode, with the
+    data column holding the JSON encoded chains and the metadata column
+    the other per-seed fields (see record_metadata), and the compressed
+    formula texts in the formulas table."""
+
+    def __init__(self, target):
+        self.connection = sqlite3.connect(target)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "seed_hash TEXT PRIMARY KEY, formula TEXT, "
+            "execution_time REAL, data TEXT, metadata TEXT)")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(results)")]
+        if "metadata" not in columns:
+            # databases written before the column existed
+            self.connection.execute("ALTER TABLE results ADD COLUMN metadata TEXT")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS formulas ("
+            "hash TEXT PRIMARY KEY, text BLOB)")
+        self.connection.commit()
+        self.known = KnownFormulas()
+
+    def write_many(self, records):
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO formulas VALUES (?, ?)",
+            [(key, compress_formula(text))
+             for key, text in self.known.new_formulas(records).items()])
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO results "
+            "(seed_hash, formula, execution_time, data, metadata) VALUES (?, ?, ?, ?, ?)",
+            [(record["seed_hash"], record["formula"],
+              record["execution_time"], json.dumps(record["data"]),
+              record_metadata(record))
+             for record in records])
+        self.connection.commit()
+
+    def done_hashes(self):
+        return set(row[0] for row in
+                   self.connection.execute("SELECT seed_hash FROM results"))
+
+    def read_record(self, seed_hash):
+        row = self.connection.execute(
+            "SELECT seed_hash, formula, execution_time, data, metadata FROM results "
+            "WHERE seed_hash = ?", (seed_hash,)).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[4]) if row[4] else {}
+        record.update({"seed_hash": row[0], "formula": row[1],
+                       "execution_time": row[2], "data": json.loads(row[3])})
+        return record
+
+    def read_formulas(self, hashes):
+        hashes = list(hashes)
+        rows = self.connection.execute(
+            "SELECT hash, text FROM formulas WHERE hash IN (%s)"
+            % ",".join("?" * len(hashes)), hashes)
+        return dict((key, decompress_formula(text)) for key, text in rows)
+
+    def close(self):
+        self.connection.close()
+
+
+def parquet_schema(types):
+    return pyarrow.schema([pyarrow.field(name, pyarrow.type_for_alias(kind), nullable=True)
+                           for name, kind in types])
+
+
+class ParquetSink(ResultSink):
+    """Writes every batch as new part files of three Parquet datasets below
+    the target directory: seeds/ with one row per seed, steps/ with one
+    row per solved formula (see step_rows) and formulas/ with the
+    compressed text of every formula hash. The per-seed fields besides
+    the chains are kept in the metadata column (see record_metadata).
+
+    Every file is written and read with the schemas of SEED_TYPES,
+    STEP_TYPES and FORMULA_TYPES, so a batch whose first step has no
+    statistics, e.g. a timeout, keeps all columns."""
+
+    def __init__(self, target):
+        if pyarrow is None:
+            raise ImportError("the parquet sink needs pyarrow installed")
+        self.directory = target
+        self.parts = 0
+        self.known = KnownFormulas()
+        self.seed_schema = parquet_schema(SEED_TYPES)
+        self.step_schema = parquet_schema(STEP_TYPES)
+        self.formula_schema = parquet_schema(FORMULA_TYPES)
+        for name in ["seeds", "steps", "formulas"]:
+            os.makedirs(os.path.join(target, name), exist_ok=True)
+
+    def _part_path(self, name):
+        # pid and time keep part names unique across runs and processes
+        return os.path.join(self.directory, name, "part-%d-%d-%05d.parquet"
+                            % (os.getpid(), time.time_ns(), self.parts))
+
+    def _step_row(self, row):
+        extra = dict((key, row.pop(key)) for key in list(row)
+                     if key not in self.step_schema.names)
+        row["extra"] = json.dumps(extra) if extra else None
+        return row
+
+    def _read(self, name, schema, filters):
+        return pyarrow.parquet.read_table(os.path.join(self.directory, name),
+                                          schema=schema, filters=filters)
+
+    def write_many(self, records):
+        seeds = pyarrow.Table.from_pylist([
+            {"seed_hash": record["seed_hash"], "formula": record["formula"],
+             "execution_time": record["execution_time"],
+             "expected": record["data"][1][1],
+             "metadata": record_metadata(record)}
+            for record in records], schema=self.seed_schema)
+        steps = pyarrow.Table.from_pylist(
+            [self._step_row(row) for record in records for row in step_rows(record)],
+            schema=self.step_schema)
+        pyarrow.parquet.write_table(seeds, self._part_path("seeds"))
+        pyarrow.parquet.write_table(steps, self._part_path("steps"))
+        formulas = self.known.new_formulas(records)
+        if formulas:
+            table = pyarrow.Table.from_pylist(
+                [{"hash": key, "text": compress_formula(text)}
+                 for key, text in formulas.items()], schema=self.formula_schema)
+            pyarrow.parquet.write_table(table, self._part_path("formulas"))
+        self.parts += 1
+
+    def done_hashes(self):
+        directory = os.path.join(self.directory, "seeds")
+        if not os.listdir(directory):
+            return set()
+        table = pyarrow.parquet.read_table(directory, columns=["seed_hash"], schema=self.seed_schema)
+        return set(table.column("seed_hash").to_pylist())
+
+    def read_record(self, seed_hash):
+        seeds = self._read("seeds", self.seed_schema, [("seed_hash", "=", seed_hash)])
+        if seeds.num_rows == 0:
+            return None
+        seed = seeds.to_pylist()[0]
+        expected = seed.pop("expected")
+        metadata = seed.pop("metadata")
+        if metadata:
+            seed.update(json.loads(metadata))
+        steps = self._read("steps", self.step_schema, [("seed_hash", "=", seed_hash)])
+        chains = dict((name, [[], expected]) for name in STRATEGIES)
+        initial = None
+        for row in sorted(steps.to_pylist(), key=lambda row: row["step"]):
+            ret = {"True": True, "False": False}.get(row["result"], row["result"])
+            step = [row["formula"], row["change_id"], ret, row["walker"],
+                    row["logic"], row["solver"], row["seconds"]]
+            extra = dict((key, value) for key, value in row.items()
+                         if key not in STEP_COLUMNS and key != "extra" and value is not None)
+            if row["extra"] is not None:
+                extra.update(json.loads(row["extra"]))
+            for key in JSON_COLUMNS:
+                if key in extra:
+                    extra[key] = json.loads(extra[key])
+            if extra:
+                step.append(extra)
+            if row["strategy"] == "initial":
+                initial = step
+            else:
+                chains[row["strategy"]][0].append(step)
+        seed["data"] = [initial] + [chains[name] for name in STRATEGIES]
+        return seed
+
+    def read_formulas(self, hashes):
+        table = self._read("formulas", self.formula_schema, [("hash", "in", list(hashes))])
+        return dict((row["hash"], decompress_formula(row["text"]))
+                    for row in table.to_pylist())
+
+
+def open_sink(name, target=None):
+    target = DEFAULT_OUTPUTS[name] if target is None else target
+    if name == "mongo":
+        return MongoSink(target)
+    if name == "jsonl":
+        return JsonlSink(target)
+    if name == "sqlite":
+        return SqliteSink(target)
+    if name == "parquet":
+        return ParquetSink(target)
+    raise ValueError("Unknown result sink '%s'" % name)
@@ -0,0 +1,129 @@
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+
+STOP = "__stop__"
+
+
+class WriterError(Exception):
+    pass
+
+
+def write_batches(records, open_sink, batch_size, flush_interval):
+    """Drains records until STOP and writes them to the sink created by
+    open_sink, in batches of batch_size or whatever arrived within
+    flush_interval seconds of the first pending record. The sink is flushed
+    flush_interval seconds after a write even when no record follows."""
+    sink = open_sink()
+    batch = []
+    deadline = None
+    flush_at = None
+    while True:
+        waits = [t for t in (deadline if batch else None, flush_at) if t is not None]
+        timeout = max(0.0, min(waits) - time.monotonic()) if waits else None
+        try:
+            record = records.get(timeout=timeout)
+        except queue.Empty:
+            record = None
+        if record is not None and record != STOP:
+            if not batch:
+                deadline = time.monotonic() + flush_interval
+            batch.append(record)
+        if batch and (record == STOP
+                      or len(batch) >= batch_size
+                      or time.monotonic() >= deadline):
+            sink.write_many(batch)
+            batch = []
+            if flush_at is None:
+                flush_at = time.monotonic() + flush_interval
+        if flush_at is not None and time.monotonic() >= flush_at:
+            sink.flush()
+            flush_at = None
+        if record == STOP:
+            sink.close()
+            return sink
+
+
+class ResultWriter(object):
+    """Single writer stage between the workers and a result sink.
+
+    Workers put finished records on ``queue``, which is bounded by
+    max_pending so that they block instead of piling up records when the
+    sink falls behind. open_sink is called once inside the writer, which
+    runs in its own process, or in a thread of the calling process when
+    in_process is set.
+
+    A writer that stopped because its sink failed makes put and close raise
+    WriterError instead of blocking on the full queue.
+    """
+
+    def __init__(self, open_sink, batch_size=64, flush_interval=2.0,
+                 max_pending=1024, in_process=False, poll_interval=1.0):
+        self.open_sink = open_sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.in_process = in_process
+        self.poll_interval = poll_interval
+        if in_process:
+            self.queue = queue.Queue(maxsize=max_pending)
+        else:
+            self.queue = multiprocessing.Queue(maxsize=max_pending)
+        self.sink = None
+        self.worker = None
+        self.error = None
+
+    def _run(self):
+        try:
+            self.sink = write_batches(self.queue, self.open_sink,
+                                      self.batch_size, self.flush_interval)
+        except Exception:
+            self.error = traceback.format_exc()
+            raise
+
+    def start(self):
+        if self.in_process:
+            self.worker = threading.Thread(target=self._run, daemon=True)
+        else:
+            self.worker = multiprocessing.Process(target=write_batches,
+                                                  args=(self.queue, self.open_sink,
+                                                        self.batch_size,
+                                                        self.flush_interval),
+                                                  daemon=True)
+        self.worker.start()
+        return self
+
+    def put(self, record):
+        while True:
+            self.check()
+            try:
+                self.queue.put(record, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                pass
+
+    def check(self):
+        """Raises WriterError if the writer stopped before it was closed."""
+        if self.worker is not None and not self.worker.is_alive():
+            if not self.in_process:
+                # nobody reads the queue anymore, exiting must not wait on it
+                self.queue.cancel_join_thread()
+            self._stopped()
+
+    def _stopped(self):
+        worker, self.worker = self.worker, None
+        raise WriterError(self.error or "result writer exited with code %s"
+                          % worker.exitcode)
+
+    def close(self):
+        """Flushes every pending record and stops the writer."""
+        if self.worker is None:
+            return
+        self.put(STOP)
+        self.worker.join()
+        if (self.sink is None) if self.in_process else self.worker.exitcode:
+            # the sink failed on the last batch
+            self._stopped()
+        self.worker = None
@@ -0,0 +1,131 @@
+from random import choice, random
+
+from pysmt.shortcuts import BOOL
+from pysmt.walkers import IdentityDagWalker
+
+from identity_shortcut import IdentityShortcutMixin
+from mutation_rules import RULES
+from mutation_sites import SiteSelectionMixin
+
+
+class RewriteDagWalker(SiteSelectionMixin, IdentityShortcutMixin, IdentityDagWalker):
+    """Common core of the random mutation walkers.
+
+    Walkers name their rules in RULES with ``walker`` and implement the
+    rewrite methods the rules refer to; a rewrite reports which rule it
+    applied through ``fired``. The rules are grouped into ``site_rules``,
+    a dict from node type to ``(name, guard, rewrite)`` entries with one
+    entry per rewrite method, which is looked up once per node: in a walk,
+    every site, a node for which the guard of one of its rules holds, draws
+    one random number, and if it is above FIRE_THRESHOLD, no rule fired yet
+    and a guard holds with the rule ready, the node is replaced by
+    ``rewrite(node, args)``. Every other node is kept as-is when its
+    children did not change, or rebuilt by IdentityDagWalker.
+
+    Nodes without a site below them draw nothing and always walk to
+    themselves, so they are kept in ``inert`` across walks; later walks,
+    including those of the mutants, which share all the subterms the
+    mutation did not touch, skip them without visiting their children.
+    """
+
+    FIRE_THRESHOLD = 0.6
+    walker = None
+
+    def __init__(self, env=None, invalidate_memoization=None,
+                 selection="retry", site_weights=None):
+        IdentityDagWalker.__init__(self,
+                                   env=env,
+                                   invalidate_memoization=invalidate_memoization)
+        self.init_site_selection(selection, site_weights)
+        self.flag_changed = False
+        self.change_id = -1
+        self.target_rule = None
+        self.symbols = set()
+        self.rule_groups = self._group_rules()
+        self.rule_table = self.site_rules()
+        self.type_rules = {}
+        for (node_type, _), rules in self.rule_groups.items():
+            self.type_rules.setdefault(node_type, []).extend(rules)
+        self.inert = set()
+
+    def _group_rules(self):
+        # (node type, rewrite name) -> rules, in registration order
+        groups = {}
+        for rule in RULES.for_walker(self.walker):
+            groups.setdefault((rule.node_type, rule.rewrite), []).append(rule)
+        return groups
+
+    def site_rules(self):
+        table = {}
+        for (node_type, rewrite), rules in self.rule_groups.items():
+            table.setdefault(node_type, []).append(
+                (rewrite, self._site_guard(rules), getattr(self, rewrite)))
+        return table
+
+    def _site_guard(self, rules):
+        if any(rule.guard is None and rule.precondition is None for rule in rules):
+            return None
+        def guard(node):
+            return any(rule.ready(self) and rule.applies(node) for rule in rules)
+        return guard
+
+    def is_site(self, node):
+        # guards only look at the node, unlike preconditions
+        return any(rule.applies(node) for rule in self.type_rules.get(node.node_type(), ()))
+
+    def allows(self, name):
+        # a rewrite that can make several rules only makes the target one
+        return self.target_rule is None or self.target_rule == name
+
+    def fired(self, name):
+        self.change_id = RULES.get(self.walker, name).rule_id
+        self.flag_changed = True
+
+    def bool_symbols(self):
+        return tuple(s for s in self.symbols if s.symbol_type() == BOOL)
+
+    def fire(self, formula, args, rules):
+        if random() <= self.FIRE_THRESHOLD or self.flag_changed:
+            return None
+        rewrites = [rewrite for _, guard, rewrite in rules if guard is None or guard(formula)]
+        if not rewrites:
+            return None
+        rewrite = rewrites[0] if len(rewrites) == 1 else choice(rewrites)
+        return rewrite(formula, args)
+
+    def _push_with_children_to_stack(self, formula, **kwargs):
+        self.stack.append((True, formula))
+        inert = self.inert if self.shortcut else ()
+        for s in self._get_children(formula):
+            if s in inert:
+                continue
+            key = self._get_key(s, **kwargs)
+            if key not in self.memoization:
+                self.stack.append((False, s))
+
+    def _compute_node_result(self, formula, **kwargs):
+        key = self._get_key(formula, **kwargs)
+        if key in self.memoization:
+            return
+        children = self._get_children(formula)
+        inert = self.inert if self.shortcut else ()
+        args = [s if s in inert else self.memoization[self._get_key(s, **kwargs)]
+                for s in children]
+        node_type = formula.node_type()
+        rules = self.rule_table.get(node_type)
+        site = rules is not None and self.is_site(formula)
+        if site:
+            result = self.fire(formula, args, rules)
+            if result is not None:
+                self.memoization[key] = result
+                return
+        if self.unchanged(formula, args):
+            if not site and all(s in inert for s in children):
+                self.inert.add(formula)
+            self.memoization[key] = formula
+            return
+        try:
+            f = self.functions[node_type]
+        except KeyError:
+            f = self.walk_error
+        self.memoization[key] = f(formula, args=args, **kwargs)
@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+from statistics import median
+
+
+# relative cost of a seed of the same size in each logic, until runs of
+# the logic have been observed
+LOGIC_WEIGHTS = {"QF_LIA": 1.0, "LIA": 2.0, "QF_LRA": 1.0, "LRA": 2.0,
+                 "QF_NRA": 4.0, "NRA": 8.0}
+# rough seconds per byte of a QF_LIA seed, only used before any run
+DEFAULT_SECONDS_PER_BYTE = 1e-5
+
+
+class CostModel(object):
+    """Estimates how long a seed takes to analyze.
+
+    A seed that was analyzed before costs what it cost then. Every other
+    seed is estimated from its file size times a per-logic rate fitted to
+    the recorded seeds of the logic (LOGIC_WEIGHTS until there are some);
+    node counts are only known after parsing, they are recorded next to
+    the times but not used for the estimate. Observations are kept in a
+    JSON file keyed by seed hash.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.observed = {}
+        self.seeds = {}
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self.observed = json.load(f)
+        self.rates = self._fit_rates()
+
+    def _fit_rates(self):
+        samples = {}
+        for entry in self.observed.values():
+            if entry.get("size"):
+                samples.setdefault(entry["logic"], []).append(entry["seconds"] / entry["size"])
+        rates = dict((logic, median(values)) for logic, values in samples.items())
+        if rates:
+            # logics without observations follow the observed ones
+            per_weight = median(rate / LOGIC_WEIGHTS.get(logic, 1.0)
+                                for logic, rate in rates.items())
+        else:
+            per_weight = DEFAULT_SECONDS_PER_BYTE
+        for logic, weight in LOGIC_WEIGHTS.items():
+            rates.setdefault(logic, per_weight * weight)
+        self.default_rate = per_weight
+        return rates
+
+    def estimate(self, seed):
+        filepath, sat_unsat, logic, digest = seed
+        entry = self.observed.get(digest)
+        if entry is not None:
+            return entry["seconds"]
+        size = os.path.getsize(filepath)
+        self.seeds[digest] = (size, logic)
+        return size * self.rates.get(logic, self.default_rate)
+
+    def record(self, digest, seconds, nodes=None):
+        # seeds that were observed before are not sized again by estimate
+        previous = self.observed.get(digest, {})
+        size, logic = self.seeds.get(digest, (previous.get("size"), previous.get("logic")))
+        self.observed[digest] = {"seconds": seconds, "nodes": nodes,
+                                 "size": size, "logic": logic}
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.observed, f)
+        os.replace(tmp_path, self.path)
+
+
+def longest_first(tasks, estimate):
+    """Returns the tasks with their cost according to estimate, most
+    expensive first."""
+    costs = [(estimate(task), task) for task in tasks]
+    costs.sort(key=lambda entry: entry[0], reverse=True)
+    return costs
+
+
+def chunks(costs, processes, factor=2, max_chunk=64):
+    """Yields lists of tasks from costs (see longest_first).
+
+    Chunk sizes follow guided scheduling: a chunk is worth about the
+    remaining cost divided by factor * processes, so expensive tasks go
+    out one by one, cheap ones in larger chunks to save round trips, and
+    chunks get smaller again towards the end so no core is left with a
+    long tail.
+    """
+    remaining = sum(cost for cost, _ in costs)
+    i = 0
+    while i < len(costs):
+        target = remaining / (factor * processes)
+        chunk = []
+        chunk_cost = 0.0
+        while i < len(costs) and len(chunk) < max_chunk and \
+              (not chunk or chunk_cost + costs[i][0] <= target):
+            chunk_cost += costs[i][0]
+            chunk.append(costs[i][1])
+            i += 1
+        remaining -= chunk_cost
+        yield chunk
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+from io import StringIO
+
+import pysmt
+from pysmt.environment import get_env
+from pysmt.fnode import FNode
+import pysmt.operators as op
+
+
+# bump whenever the encoding below or the way seeds are parsed changes
+CACHE_FORMAT = 1
+PARSER_VERSION = "pysmt-%s/%d" % (pysmt.__version__, CACHE_FORMAT)
+
+
+def encode_formula(formula):
+    """Serializes formula as a zlib compressed table of its DAG nodes in
+    post-order. Every node refers to its arguments (and to the FNodes in its
+    payload, e.g. quantified variables) by their position in the table."""
+    position = {}
+    table = []
+    stack = [(formula, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if node in position:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            for child in _node_children(node):
+                if child not in position:
+                    stack.append((child, False))
+            continue
+        args = tuple(position[a] for a in node.args())
+        table.append((node.node_type(), args,
+                      _encode_payload(node._content.payload, position)))
+        position[node] = len(table) - 1
+    return zlib.compress(pickle.dumps(table, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def decode_formula(data, env=None):
+    """Rebuilds a formula encoded by encode_formula inside env, so that the
+    result is interned exactly like a freshly parsed one."""
+    env = env if env is not None else get_env()
+    mgr = env.formula_manager
+    table = pickle.loads(zlib.decompress(data))
+    nodes = []
+    for node_type, args, payload in table:
+        payload = _decode_payload(payload, nodes)
+        if node_type == op.SYMBOL:
+            name, typename = payload
+            node = mgr.Symbol(name, env.type_manager.normalize(typename))
+        else:
+            node = mgr.create_node(node_type,
+                                   tuple(nodes[i] for i in args),
+                                   payload)
+        nodes.append(node)
+    return nodes[-1]
+
+
+def _node_children(node):
+    payload = node._content.payload
+    if isinstance(payload, FNode):
+        return node.args() + (payload,)
+    if isinstance(payload, tuple) and payload and \
+       all(isinstance(p, FNode) for p in payload):
+        return node.args() + payload
+    return node.args()
+
+
+def _encode_payload(payload, position):
+    if isinstance(payload, FNode):
+        return ("node", position[payload])
+    if isinstance(payload, tuple) and payload and \
+       all(isinstance(p, FNode) for p in payload):
+        return ("nodes", tuple(position[p] for p in payload))
+    return ("value", payload)
+
+
+def _decode_payload(payload, nodes):
+    kind, value = payload
+    if kind == "node":
+        return nodes[value]
+    if kind == "nodes":
+        return tuple(nodes[i] for i in value)
+    return value
+
+
+class SeedCache(object):
+    """On-disk cache of parsed seeds.
+
+    Entries are keyed by the hash of the .smt2 file content together with
+    PARSER_VERSION, so an edited seed or a new pysmt version simply misses
+    the cache and only that seed is parsed again.
+    """
+
+    def __init__(self, directory, env=None):
+        self.directory = directory
+        self.env = env
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, content):
+        digest = hashlib.sha256(PARSER_VERSION.encode())
+        digest.update(content)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".bin")
+
+    def load(self, filepath, parser):
+        with open(filepath, "rb") as f:
+            content = f.read()
+        key = self.key(content)
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                formula = decode_formula(f.read(), env=self.env)
+            self.hits += 1
+            return formula
+        except (FileNotFoundError, EOFError, zlib.error,
+                pickle.UnpicklingError):
+            # missing or unreadable entry, parse the seed again
+            pass
+        self.misses += 1
+        script = parser.get_script(StringIO(content.decode()))
+        formula = script.get_last_formula()
+        self.store(path, encode_formula(formula))
+        return formula
+
+    def store(self, path, data):
+        # write to a temporary file first so concurrent workers never see
+        # a partially written entry
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Measures how long it takes to load the seed corpus without the
+# parsed-seed cache, with an empty cache (cold) and with a filled one (warm).
+# Every pass runs in a fresh process so that no pysmt state is shared.
+
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from pysmt.environment import push_env, pop_env
+from pysmt.smtlib.parser import SmtLibParser
+
+from benchmark import SEED_PATH, discover_seeds
+from seed_cache import SeedCache
+
+
+def load_corpus(seed_path, cache_dir, results):
+    cache = SeedCache(cache_dir) if cache_dir else None
+    loaded = failed = 0
+    start = time.perf_counter()
+    for filepath, _, _ in discover_seeds(seed_path):
+        # every seed is parsed in an environment of its own, like in the
+        # benchmark workers, seeds may declare the same name with other sorts
+        push_env()
+        try:
+            parser = SmtLibParser()
+            if cache is None:
+                with open(filepath, "r") as f:
+                    parser.get_script(f).get_last_formula()
+            else:
+                cache.load(filepath, parser)
+            loaded += 1
+        except Exception:
+            failed += 1
+        finally:
+            pop_env()
+    end = time.perf_counter()
+    results.put((end - start, loaded, failed,
+                 cache.hits if cache else 0, cache.misses if cache else 0))
+
+
+def run_pass(seed_path, cache_dir):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=load_corpus,
+                                      args=(seed_path, cache_dir, results))
+    process.start()
+    ret = results.get()
+    process.join()
+    return ret
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Cold vs warm startup of the parsed-seed cache")
+    arg_parser.add_argument("--seed-path", default=SEED_PATH)
+    arg_parser.add_argument("--repeat", type=int, default=3,
+                            help="number of warm passes")
+    args = arg_parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="seed_cache_")
+    try:
+        passes = [("no cache", run_pass(args.seed_path, None)),
+                  ("cold", run_pass(args.seed_path, cache_dir))]
+        for i in range(args.repeat):
+            passes.append(("warm %d" % (i + 1), run_pass(args.seed_path, cache_dir)))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print("{: <10}{: >12}{: >10}{: >10}{: >8}{: >8}".format(
+        "pass", "seconds", "loaded", "failed", "hits", "misses"))
+    for name, (seconds, loaded, failed, hits, misses) in passes:
+        print("{: <10}{: >12.3f}{: >10}{: >10}{: >8}{: >8}".format(
+            name, seconds, loaded, failed, hits, misses))
+
+
+if __name__ == "__main__":
+    main()
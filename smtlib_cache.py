@@ -0,0 +1,119 @@
+import hashlib
+from collections import OrderedDict
+from io import StringIO
+
+from pysmt.smtlib.printers import SmtDagPrinter
+
+
+# stands in for the let name while the binding of a node is printed
+PLACEHOLDER = "\x00"
+
+
+class IncrementalDagPrinter(SmtDagPrinter):
+    """SmtDagPrinter that remembers the let binding written for every node.
+
+    The name of a binding is derived from a hash of the binding itself,
+    which mentions the names of the bindings of its children, so a node
+    prints the same way in every formula it occurs in. A mutant that shares
+    most of its DAG with its parent only prints the nodes on the changed
+    spine, the bindings of every other node are copied from the cache.
+
+    Whole formulas are cached as well, both caches are bounded LRUs keyed
+    by FNode identity.
+    """
+
+    def __init__(self, template=".def_%s", max_nodes=1 << 17, max_formulas=256):
+        SmtDagPrinter.__init__(self, StringIO(), template=template)
+        self.max_nodes = max_nodes
+        self.max_formulas = max_formulas
+        self.bindings = OrderedDict()
+        self.texts = OrderedDict()
+        self.parts = None
+
+    def to_smtlib(self, formula):
+        text = self.texts.get(formula)
+        if text is not None:
+            self.texts.move_to_end(formula)
+            return text
+        self.openings = 0
+        self.parts = []
+        try:
+            for node in self._post_order(formula):
+                self._print_node(node)
+            self.parts.append(self.memoization[formula])
+            self.parts.append(")" * self.openings)
+            text = "".join(self.parts)
+        finally:
+            self.parts = None
+            self.memoization.clear()
+        self.texts[formula] = text
+        if len(self.texts) > self.max_formulas:
+            self.texts.popitem(last=False)
+        return text
+
+    def printer(self, f):
+        self.write(self.to_smtlib(f))
+
+    def _new_symbol(self):
+        return PLACEHOLDER
+
+    def _post_order(self, formula):
+        # the order DagWalker visits the nodes in, without its bookkeeping;
+        # quantifiers print their body on their own
+        order = []
+        seen = set()
+        stack = [(formula, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.append((node, True))
+            if not node.is_quantifier():
+                for child in node.args():
+                    if child not in seen:
+                        stack.append((child, False))
+        return order
+
+    def _print_node(self, formula):
+        entry = self.bindings.get(formula)
+        if entry is None:
+            entry = self._new_binding(formula)
+            self.bindings[formula] = entry
+            if len(self.bindings) > self.max_nodes:
+                self.bindings.popitem(last=False)
+        else:
+            self.bindings.move_to_end(formula)
+        name, binding, openings = entry
+        self.parts.append(binding)
+        self.openings += openings
+        self.memoization[formula] = name
+
+    def _new_binding(self, formula):
+        stream, write, openings = self.stream, self.write, self.openings
+        self.stream = StringIO()
+        self.write = self.stream.write
+        self.openings = 0
+        try:
+            if formula.is_quantifier():
+                name = self.functions[formula.node_type()](formula, args=None)
+            else:
+                name = self.functions[formula.node_type()](
+                    formula, args=[self.memoization[a] for a in formula.args()])
+            binding = self.stream.getvalue()
+            node_openings = self.openings
+        finally:
+            self.stream, self.write, self.openings = stream, write, openings
+        if PLACEHOLDER in binding:
+            digest = hashlib.sha1(binding.encode()).hexdigest()[:20]
+            sym = self.template % digest
+            binding = binding.replace(PLACEHOLDER, sym)
+            name = name.replace(PLACEHOLDER, sym)
+        return name, binding, node_openings
+
+    def clear(self):
+        self.bindings.clear()
+        self.texts.clear()
@@ -0,0 +1,94 @@
+import time
+
+from pysmt.environment import get_env
+from pysmt.exceptions import SolverReturnedUnknownResultError
+from pysmt.oracles import get_logic
+
+
+# solver option that limits a single check, in milliseconds
+TIMEOUT_OPTIONS = {"z3": "timeout", "cvc4": "tlimit-per"}
+
+
+class SolverTimeoutError(SolverReturnedUnknownResultError):
+    """The solver gave up on a check because it ran out of time."""
+    pass
+
+
+def solver_options(solver_name, timeout):
+    if not timeout or solver_name not in TIMEOUT_OPTIONS:
+        return {}
+    return {TIMEOUT_OPTIONS[solver_name]: int(timeout * 1000)}
+
+
+def solve(solver, timeout):
+    start = time.monotonic()
+    try:
+        return solver.solve()
+    except SolverReturnedUnknownResultError:
+        # solvers only report unknown, running out of the time limit is
+        # what tells a timeout apart
+        if timeout and time.monotonic() - start >= timeout * 0.95:
+            raise SolverTimeoutError()
+        raise
+
+
+def is_sat_once(formula, solver_name, logic=None, timeout=None, env=None):
+    """Checks formula with a solver created only for this check."""
+    env = env if env is not None else get_env()
+    if logic is None:
+        logic = get_logic(formula, env)
+    with env.factory.Solver(name=solver_name, logic=logic,
+                            solver_options=solver_options(solver_name, timeout)) as solver:
+        solver.add_assertion(formula)
+        return solve(solver, timeout)
+
+
+class SolverSession(object):
+    """Keeps one live solver per (solver, logic) pair for the lifetime of a
+    worker.
+
+    Every formula is checked inside its own push/pop scope, so a mutation
+    chain only pays for solver creation once instead of once per mutant.
+    With a timeout (in seconds) every check is limited through the solver's
+    own option and raises SolverTimeoutError when it runs out.
+    """
+
+    def __init__(self, env=None, timeout=None):
+        self.env = env if env is not None else get_env()
+        self.timeout = timeout
+        self.solvers = {}
+
+    def get_solver(self, solver_name, logic):
+        key = (solver_name, logic)
+        solver = self.solvers.get(key)
+        if solver is None:
+            solver = self.env.factory.Solver(name=solver_name, logic=logic,
+                                             solver_options=solver_options(solver_name, self.timeout))
+            self.solvers[key] = solver
+        return solver
+
+    def is_sat(self, formula, solver_name, logic):
+        solver = self.get_solver(solver_name, logic)
+        try:
+            solver.push()
+            try:
+                solver.add_assertion(formula)
+                return solve(solver, self.timeout)
+            finally:
+                solver.pop()
+        except SolverReturnedUnknownResultError:
+            raise
+        except Exception:
+            # the solver is in an unknown state, start from a fresh one
+            # on the next query
+            self.close_solver(solver_name, logic)
+            raise
+
+    def close_solver(self, solver_name, logic):
+        solver = self.solvers.pop((solver_name, logic), None)
+        if solver is not None:
+            solver.exit()
+
+    def close(self):
+        for solver_name, logic in list(self.solvers):
+            self.close_solver(solver_name, logic)
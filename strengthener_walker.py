@@ -1,324 +1,57 @@
-from pysmt.shortcuts import Or, Symbol, Solver, And, Implies, Not, REAL, BOOL
+from pysmt.shortcuts import Or, Symbol, Solver, And, Implies, Not, REAL
 from random import choice, randint, random
-from pysmt.walkers.dag import DagWalker
 
+from rewrite_walker import RewriteDagWalker
 
-class RandomStrengthenerDagWalker(DagWalker):
-    """This class traverses a formula and rebuilds it recursively
-    identically.
 
-    This could be useful when only some nodes needs to be rewritten
-    but the structure of the formula has to be kept.
-    """
-    
-    
+class RandomStrengthenerDagWalker(RewriteDagWalker):
+    """Mutates a formula into a stronger one, see RewriteDagWalker."""
 
+    walker = "strengthen"
 
-    def __init__(self, env=None, invalidate_memoization=None):
-        DagWalker.__init__(self,
-                           env=env,
-                           invalidate_memoization=invalidate_memoization)
-        self.mgr = self.env.formula_manager
-        self.flag_changed = False
-        self.change_id = -1
-        self.symbols = set()
-
-    def change_once(self,formula,symbols,old_formula):
-        self.symbols = symbols
-        if self.flag_changed:
-            self.flag_changed = False
-            self.change_id = -1
-        i = 0
-        while not self.flag_changed and i < 20:
-   
-            ret = self.walk(formula)
-            i+=1    
-        self.symbols = set()
-        return ret 
-        
-
-    def walk_symbol(self, formula, args, **kwargs):
-        
-        threshhold = random()
-        symbol = self.mgr.Symbol(formula.symbol_name(),
-                               formula.symbol_type())
-        if threshhold > 0.6 and not self.flag_changed and len(self.symbols) > 1 and symbol.symbol_type() == BOOL:
-            self.change_id= 1
-            self.flag_changed = True
-            
-            symbol_weakener = choice(tuple(self.symbols))
-            symbol_weakener = self.mgr.Symbol(symbol_weakener.symbol_name(),
-                               symbol_weakener.symbol_type())
-            return self.mgr.And(symbol,symbol_weakener)
-            
+    def strengthen_symbol(self, formula, args):
+        self.fired("symbol_and_symbol")
         
-        return symbol
-
-    def walk_algebraic_constant(self, formula, args, **kwargs):
-        return self.mgr._Algebraic(formula.constant_value())
-
-    def walk_real_constant(self, formula, args, **kwargs):
-        return self.mgr.Real(formula.constant_value())
-
-    def walk_int_constant(self, formula, args, **kwargs):
-        return self.mgr.Int(formula.constant_value())
-
-    def walk_bool_constant(self, formula, args, **kwargs):
-        return self.mgr.Bool(formula.constant_value())
-
-    def walk_str_constant(self, formula, **kwargs):
-        return self.mgr.String(formula.constant_value())
+        symbol_weakener = choice(self.bool_symbols())
+        symbol_weakener = self.mgr.Symbol(symbol_weakener.symbol_name(),
+                           symbol_weakener.symbol_type())
+        return self.mgr.And(formula,symbol_weakener)
 
-    def walk_and(self, formula, args, **kwargs):        
-        return self.mgr.And(args)
-
-    def walk_or(self, formula, args, **kwargs):
-        threshhold = random()
-        #print(len(args))
-        #if or has more than two inputs, we need to select which one to randomly transfrom
-        if threshhold > 0.6 and not self.flag_changed:
-            
-            threshhold2 = random()
-            self.change_id= 0
-            self.flag_changed = True
-            if threshhold2 < 0.5:
-                ind = randint(0,len(args)-1)
-                if(len(args) > 2): 
-                    split  = args[:ind] + args[ind + 1:]
-                    return self.mgr.Or(split)
-                
-                return args[ind]
-            else:
-                self.change_id= 2   
-                ind = randint(0,len(args)-2)
-                split  = args[:ind] + args[ind + 2:]
-                split.append(self.mgr.Or( self.mgr.And(args[0], self.mgr.Not(args[1])), self.mgr.And(self.mgr.Not(args[0]),args[1]) ) )
+    def strengthen_or(self, formula, args):
+        threshhold2 = random()
+        if self.target_rule == "or_drop_operand" or (self.target_rule is None and threshhold2 < 0.5):
+            self.fired("or_drop_operand")
+            ind = randint(0,len(args)-1)
+            if(len(args) > 2): 
+                split  = args[:ind] + args[ind + 1:]
                 return self.mgr.Or(split)
-                if(len(args) > 2): 
-                    return self.mgr.Or(args)
-                
-                #if args[0].node_type() == 7 and args[1].node_type() == 7:
-                    #(a and not b) or (not a and b)
-                #    return self.mgr.BVXor(args[0], args[1])    
             
-        return self.mgr.Or(args)
-
-    def walk_not(self, formula, args, **kwargs):
-        threshhold = random()
-        if threshhold > 0.6 and args[0].node_type() == 18:
-            self.change_id= 5
-            self.flag_changed = True
-            threshhold2 = random()
-            eq_args = args[0].args()
-            
-            if threshhold2 > 0.5:
-                return self.mgr.LT(eq_args[0],eq_args[1])
-            else:
-                return self.mgr.LT(eq_args[1],eq_args[0])
-        
-        return self.mgr.Not(args[0])
-
-    def walk_iff(self, formula, args, **kwargs):
-        return self.mgr.Iff(args[0], args[1])
-
-    def walk_implies(self, formula, args, **kwargs):
-        #print(args[0].node_type())
-        
-        threshhold = random()
-        
-        if threshhold > 0.6 and not self.flag_changed and args[0].node_type() == 4:
-            threshhold2 = random()
-            self.change_id= 3
-            self.flag_changed = True
-            return self.mgr.Or(args[0].args()[0],args[1])
+            return args[ind]
+        else:
+            self.fired("or_to_xor")
+            ind = randint(0,len(args)-2)
+            split  = args[:ind] + args[ind + 2:]
+            split.append(self.mgr.Or( self.mgr.And(args[0], self.mgr.Not(args[1])), self.mgr.And(self.mgr.Not(args[0]),args[1]) ) )
+            return self.mgr.Or(split)
             
-        return self.mgr.Implies(args[0], args[1])
-
-    def walk_equals(self, formula, args, **kwargs):
-        
-        return self.mgr.Equals(args[0], args[1])
-
-    def walk_ite(self, formula, args, **kwargs):
-        return self.mgr.Ite(args[0], args[1], args[2])
-
-    def walk_le(self, formula, args, **kwargs):
-        
-        threshhold = random()
-        
-        if threshhold > 0.6 and not self.flag_changed:
-            self.change_id= 6
-            self.flag_changed = True
-            return self.mgr.LT(args[1], args[0])
-
-        
-        return self.mgr.LE(args[0], args[1])
-
-    def walk_lt(self, formula, args, **kwargs):
-
-        return self.mgr.LT(args[0], args[1])
-
-    def walk_forall(self, formula, args, **kwargs):
-        qvars = [self.walk_symbol(v, args, **kwargs)
-                 for v in formula.quantifier_vars()]
-        return self.mgr.ForAll(qvars, args[0])
-
-    def walk_exists(self, formula, args, **kwargs):
-        qvars = [self.walk_symbol(v, args, **kwargs)
-                 for v in formula.quantifier_vars()]
-        return self.mgr.Exists(qvars, args[0])
-
-    def walk_plus(self, formula, args, **kwargs):        
-        return self.mgr.Plus(args)
-
-    def walk_times(self, formula, args, **kwargs):
-        return self.mgr.Times(args)
-
-    def walk_pow(self, formula, args, **kwargs):
-        
-        return self.mgr.Pow(args[0], args[1])
-
-    def walk_minus(self, formula, args, **kwargs):
-        return self.mgr.Minus(args[0], args[1])
-
-    def walk_function(self, formula, args, **kwargs):
-        # We re-create the symbol name
-        old_name = formula.function_name()
-        new_name = self.walk_symbol(old_name, args, **kwargs)
-        return self.mgr.Function(new_name, args)
-
-    def walk_toreal(self, formula, args, **kwargs):
-        return self.mgr.ToReal(args[0])
-
-    def walk_bv_constant(self, formula, **kwargs):
-        return self.mgr.BV(formula.constant_value(), formula.bv_width())
-
-    def walk_bv_and(self, formula, args, **kwargs):
-        return self.mgr.BVAnd(args[0], args[1])
-
-    def walk_bv_not(self, formula, args, **kwargs):
-        return self.mgr.BVNot(args[0])
-
-    def walk_bv_neg(self, formula, args, **kwargs):
-        return self.mgr.BVNeg(args[0])
-
-    def walk_bv_or(self, formula, args, **kwargs):
-        return self.mgr.BVOr(args[0], args[1])
-
-    def walk_bv_xor(self, formula, args, **kwargs):
-        return self.mgr.BVXor(args[0], args[1])
-
-    def walk_bv_add(self, formula, args, **kwargs):
-        return self.mgr.BVAdd(args[0], args[1])
-
-    def walk_bv_sub(self, formula, args, **kwargs):
-        return self.mgr.BVSub(args[0], args[1])
-
-    def walk_bv_mul(self, formula, args, **kwargs):
-        return self.mgr.BVMul(args[0], args[1])
-
-    def walk_bv_udiv(self, formula, args, **kwargs):
-        return self.mgr.BVUDiv(args[0], args[1])
-
-    def walk_bv_urem(self, formula, args, **kwargs):
-        return self.mgr.BVURem(args[0], args[1])
-
-    def walk_bv_ult(self, formula, args, **kwargs):
-        return self.mgr.BVULT(args[0], args[1])
-
-    def walk_bv_ule(self, formula, args, **kwargs):
-        return self.mgr.BVULE(args[0], args[1])
-
-    def walk_bv_extract(self, formula, args, **kwargs):
-        return self.mgr.BVExtract(args[0],
-                                  start=formula.bv_extract_start(),
-                                  end=formula.bv_extract_end())
-
-    def walk_bv_ror(self, formula, args, **kwargs):
-        return self.mgr.BVRor(args[0], formula.bv_rotation_step())
-
-    def walk_bv_rol(self, formula, args, **kwargs):
-        return self.mgr.BVRol(args[0], formula.bv_rotation_step())
-
-    def walk_bv_sext(self, formula, args, **kwargs):
-        return self.mgr.BVSExt(args[0], formula.bv_extend_step())
-
-    def walk_bv_zext(self, formula, args, **kwargs):
-        return self.mgr.BVZExt(args[0], formula.bv_extend_step())
-
-    def walk_bv_concat(self, formula, args, **kwargs):
-        return self.mgr.BVConcat(args[0], args[1])
-
-    def walk_bv_lshl(self, formula, args, **kwargs):
-        return self.mgr.BVLShl(args[0], args[1])
-
-    def walk_bv_lshr(self, formula, args, **kwargs):
-        return self.mgr.BVLShr(args[0], args[1])
-
-    def walk_bv_ashr(self, formula, args, **kwargs):
-        return self.mgr.BVAShr(args[0], args[1])
-
-    def walk_bv_comp(self, formula, args, **kwargs):
-        return self.mgr.BVComp(args[0], args[1])
-
-    def walk_bv_slt(self, formula, args, **kwargs):
-        return self.mgr.BVSLT(args[0], args[1])
-
-    def walk_bv_sle(self, formula, args, **kwargs):
-        return self.mgr.BVSLE(args[0], args[1])
-
-    def walk_bv_sdiv(self, formula, args, **kwargs):
-        return self.mgr.BVSDiv(args[0], args[1])
-
-    def walk_bv_srem(self, formula, args, **kwargs):
-        return self.mgr.BVSRem(args[0], args[1])
-
-    def walk_str_length(self, formula, args, **kwargs):
-        return self.mgr.StrLength(args[0])
-
-    def walk_str_concat(self, formula, args, **kwargs):
-        return self.mgr.StrConcat(args)
-
-    def walk_str_contains(self, formula, args, **kwargs):
-        return self.mgr.StrContains(args[0], args[1])
-
-    def walk_str_indexof(self, formula, args, **kwargs):
-        return self.mgr.StrIndexOf(args[0], args[1], args[2])
-
-    def walk_str_replace(self, formula, args, **kwargs):
-        return self.mgr.StrReplace(args[0], args[1], args[2])
-
-    def walk_str_substr(self, formula, args, **kwargs):
-        return self.mgr.StrSubstr(args[0], args[1], args[2])
-
-    def walk_str_prefixof(self, formula, args, **kwargs):
-        return self.mgr.StrPrefixOf(args[0], args[1])
-
-    def walk_str_suffixof(self, formula, args, **kwargs):
-        return self.mgr.StrSuffixOf(args[0], args[1])
-
-    def walk_str_to_int(self, formula, args, **kwargs):
-        return self.mgr.StrToInt(args[0])
-
-    def walk_int_to_str(self, formula, args, **kwargs):
-        return self.mgr.IntToStr(args[0])
-
-    def walk_str_charat(self, formula, args, **kwargs):
-        return self.mgr.StrCharAt(args[0], args[1])
-
-    def walk_bv_tonatural(self, formula, args, **kwargs):
-        return self.mgr.BVToNatural(args[0])
-
-    def walk_array_select(self, formula, args, **kwargs):
-        return self.mgr.Select(args[0], args[1])
-
-    def walk_array_store(self, formula, args, **kwargs):
-        return self.mgr.Store(args[0], args[1], args[2])
-
-    def walk_array_value(self, formula, args, **kwargs):
-        assign = dict(zip(args[1::2], args[2::2]))
-        return self.mgr.Array(formula.array_value_index_type(),
-                              args[0],
-                              assign)
-
-    def walk_div(self, formula, args, **kwargs):
-        return self.mgr.Div(args[0], args[1])
\ No newline at end of file
+            #if args[0].node_type() == 7 and args[1].node_type() == 7:
+                #(a and not b) or (not a and b)
+            #    return self.mgr.BVXor(args[0], args[1])    
+
+    def strengthen_not(self, formula, args):
+        self.fired("not_equals_to_lt")
+        threshhold2 = random()
+        eq_args = args[0].args()
+        
+        if threshhold2 > 0.5:
+            return self.mgr.LT(eq_args[0],eq_args[1])
+        else:
+            return self.mgr.LT(eq_args[1],eq_args[0])
+
+    def strengthen_implies(self, formula, args):
+        self.fired("implies_not_to_or")
+        return self.mgr.Or(args[0].args()[0],args[1])
+
+    def strengthen_le(self, formula, args):
+        self.fired("le_to_lt")
+        return self.mgr.LT(args[1], args[0])
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+
+class SymbolCollector(object):
+    """Collects the symbols of a formula, grouped by sort, without
+    rebuilding it.
+
+    Quantified variables and the names of applied functions are collected
+    as well, like SymbolDagWalker does. Results are cached per FNode id in a
+    bounded LRU, so looking up the same formula again along a mutation
+    chain is free while the memory of a long running worker stays bounded.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+
+    def symbols_by_sort(self, formula):
+        key = formula.node_id()
+        entry = self.cache.get(key)
+        # node ids are only unique within one environment
+        if entry is not None and entry[0] is formula:
+            self.cache.move_to_end(key)
+            return entry[1]
+        by_sort = self._collect(formula)
+        self.cache[key] = (formula, by_sort)
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return by_sort
+
+    def symbols(self, formula):
+        by_sort = self.symbols_by_sort(formula)
+        return frozenset().union(*by_sort.values())
+
+    def _collect(self, formula):
+        by_sort = {}
+        seen = set()
+        stack = [formula]
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            if node.is_symbol():
+                by_sort.setdefault(node.symbol_type(), set()).add(node)
+                continue
+            if node.is_quantifier():
+                stack.extend(node.quantifier_vars())
+            elif node.is_function_application():
+                stack.append(node.function_name())
+            stack.extend(node.args())
+        return dict((sort, frozenset(symbols))
+                    for sort, symbols in by_sort.items())
+
+    def clear(self):
+        self.cache.clear()
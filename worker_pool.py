@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+import resource
+import time
+import traceback
+from multiprocessing.connection import wait
+
+
+def rss_bytes():
+    """Resident set size of the calling process."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes(pid=None):
+    """Highest resident set size the process pid, by default the calling
+    one, has reached, None if that is not known for another process."""
+    try:
+        with open("/proc/%s/status" % ("self" if pid is None else pid), "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if pid is not None:
+        return None
+    # kilobytes on linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cpu_time_ns(pid):
+    """CPU time process pid has used, in nanoseconds, None if that is not
+    known."""
+    try:
+        # time spent on a CPU, in nanoseconds
+        with open("/proc/%d/schedstat" % pid, "r") as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open("/proc/%d/stat" % pid, "r") as f:
+            # the fields after the parenthesized command name, utime and
+            # stime are the 14th and 15th field of the line
+            fields = f.read().rpartition(")")[2].split()
+        ticks = int(fields[11]) + int(fields[12])
+        return ticks * 10**9 // os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def reset_peak_rss(pid):
+    """Sets the peak RSS of process pid back to its current RSS, returns
+    whether that worked (linux 4.0 and later)."""
+    try:
+        with open("/proc/%d/clear_refs" % pid, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def run_worker(conn, func, initializer, initargs, cpus):
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        # a chunk of tasks, answered one result at a time
+        for task in message:
+            try:
+                result = (True, func(task))
+            except Exception as e:
+                result = (False, "%s\n%s" % (e, traceback.format_exc()))
+            conn.send(result + ((rss_bytes(), peak_rss_bytes()),))
+
+
+class WorkerError(Exception):
+    pass
+
+
+class Worker(object):
+
+    def __init__(self, func, initializer, initargs, cpus=None):
+        self.cpus = cpus
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=run_worker,
+                                               args=(child_conn, func, initializer, initargs, cpus),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = []
+        self.started = None
+        self.tasks_done = 0
+        self.rss = 0
+        self.peak_rss = 0
+
+    @property
+    def task(self):
+        """The task the worker is running, None when it is idle."""
+        return self.tasks[0] if self.tasks else None
+
+    def assign(self, tasks):
+        self.tasks = list(tasks)
+        self.started = time.monotonic()
+        self.conn.send(self.tasks)
+
+    def finish(self):
+        # the next task of the chunk starts right away
+        task = self.tasks.pop(0)
+        self.started = time.monotonic() if self.tasks else None
+        return task
+
+    def abandon(self):
+        """Returns the tasks of the chunk that were not started."""
+        rest = self.tasks[1:]
+        del self.tasks[1:]
+        return rest
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WatchdogPool(object):
+    """Process pool with a watchdog for tasks that never return.
+
+    Works like multiprocessing.Pool.imap_unordered, but every worker gets
+    its tasks over its own pipe, so the pool always knows which task a
+    worker is running. A worker that spends more than task_timeout seconds
+    on one task, or that dies, is killed and replaced by a fresh one, the
+    task is given up and recorded in ``lost`` and the other workers and
+    their results are not affected. Given up tasks yield None.
+
+    task_timeout may also be a function of the task. With chunked set, the
+    iterable yields lists of tasks that are sent to a worker in one go to
+    save round trips; the results and the watchdog are still per task, and
+    the tasks of a chunk that a killed worker did not start go to the next
+    idle worker.
+
+    Workers report their memory after every task. A worker is retired and
+    replaced once it has run max_tasks tasks or its RSS exceeds max_rss
+    bytes. ``memory`` keeps (pid, tasks, peak RSS) of every worker that
+    ran, retired or not.
+
+    With cpus, a list of CPU lists with one entry per process, every worker
+    is pinned to its own entry and its replacements to the same one.
+    """
+
+    def __init__(self, processes=None, initializer=None, initargs=(),
+                 task_timeout=None, poll_interval=1.0, max_tasks=None,
+                 max_rss=None, cpus=None):
+        self.processes = processes or (len(cpus) if cpus else multiprocessing.cpu_count())
+        self.cpus = cpus
+        self.initializer = initializer
+        self.initargs = initargs
+        self.task_timeout = task_timeout
+        self.poll_interval = poll_interval
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.workers = []
+        self.lost = []
+        self.retired = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.terminate()
+
+    def _spawn(self, func, cpus=None):
+        worker = Worker(func, self.initializer, self.initargs, cpus)
+        self.workers.append(worker)
+        return worker
+
+    def _replace(self, worker, func, pending):
+        pending.append(worker.abandon())
+        self.lost.append(worker.finish())
+        self.workers.remove(worker)
+        self.retired.append(worker)
+        worker.kill()
+        return self._spawn(func, worker.cpus)
+
+    def _recycle(self, worker, func):
+        if (self.max_tasks and worker.tasks_done >= self.max_tasks) or \
+           (self.max_rss and worker.rss >= self.max_rss):
+            self.workers.remove(worker)
+            self.retired.append(worker)
+            worker.stop()
+            return self._spawn(func, worker.cpus)
+        return worker
+
+    @property
+    def memory(self):
+        return [(w.process.pid, w.tasks_done, w.peak_rss)
+                for w in self.retired + self.workers]
+
+    def imap_unordered(self, func, iterable, chunked=False):
+        chunks = iter(iterable) if chunked else ([task] for task in iterable)
+        while len(self.workers) < self.processes:
+            self._spawn(func, self.cpus[len(self.workers)] if self.cpus else None)
+        idle = list(self.workers)
+        # unstarted tasks of the chunks of killed workers
+        pending = []
+        exhausted = False
+        while True:
+            pending = [chunk for chunk in pending if chunk]
+            while idle and pending:
+                idle.pop().assign(pending.pop(0))
+            while idle and not exhausted:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if chunk:
+                    idle.pop().assign(chunk)
+            busy = dict((w.conn, w) for w in self.workers if w.task is not None)
+            if not busy:
+                return
+            for conn in wait(list(busy), timeout=self.poll_interval):
+                worker = busy[conn]
+                try:
+                    ok, value, (worker.rss, worker.peak_rss) = conn.recv()
+                except (EOFError, OSError):
+                    # the worker died on its task
+                    idle.append(self._replace(worker, func, pending))
+                    yield None
+                    continue
+                worker.finish()
+                worker.tasks_done += 1
+                if worker.task is None:
+                    idle.append(self._recycle(worker, func))
+                if not ok:
+                    raise WorkerError(value)
+                yield value
+            if self.task_timeout:
+                now = time.monotonic()
+                for worker in list(busy.values()):
+                    if worker.task is None:
+                        continue
+                    limit = self.task_timeout(worker.task) if callable(self.task_timeout) \
+                        else self.task_timeout
+                    if limit and now - worker.started > limit:
+                        idle.append(self._replace(worker, func, pending))
+                        yield None
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        self.retired.extend(self.workers)
+        self.workers = []
+
+    def terminate(self):
+        for worker in self.workers:
+            worker.kill()
+        self.retired.extend(self.workers)
+        self.workers = []